@@ -14,6 +14,7 @@ from datetime import datetime, timedelta
 from google import genai
 from google.genai import types
 import chromadb
+from chromadb.config import Settings
 import logging
 from logging.handlers import RotatingFileHandler
 from email.mime.multipart import MIMEMultipart
@@ -26,13 +27,23 @@ from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from sentence_transformers import SentenceTransformer, CrossEncoder
-from openai import OpenAI
+from openai import AsyncOpenAI, APIConnectionError
 from pathlib import Path
 from dotenv import load_dotenv
 from urllib.parse import quote
 import re
 import requests
 import base64
+import asyncio
+import functools
+import hashlib
+import unicodedata
+import copy
+import time
+import threading
+import httpx
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # --- REPORTLAB (GERADOR DE PDF) ---
 from reportlab.lib.pagesizes import A4
@@ -41,6 +52,12 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as ImageRL
 from reportlab.lib.utils import ImageReader
 from cachetools import TTLCache
+from indice_vetorial import IndiceVetorial
+from tokens_passagens import TokensPassagens, TOKENS_PASSAGENS_DIR, texto_passagem
+from jurimetria import classificar_resultado as classificar_desfecho
+from textos_decisoes import TextosDecisoes, TEXTOS_DECISOES_DIR
+from micro_lotes import MicroBatcher
+import torch
 
 # --- CONFIGURAÇÃO DE LOGGING ---
 logging.basicConfig(
@@ -76,7 +93,10 @@ app.add_middleware(
 CURRENT_DIR = Path(__file__).resolve().parent
 DB_DIR = CURRENT_DIR
 CHROMA_DB_DIR = DB_DIR / "chroma_db"
+INDICE_NUMPY_DIR = DB_DIR / "indice_numpy"
+ALIAS_COLECOES_PATH = DB_DIR / "colecoes_alias.json"
 ASSETS_DIR = CURRENT_DIR.parent / "public" / "assets"
+ONNX_DIR = DB_DIR / "modelos_onnx"
 
 # Configurações do PostgreSQL (Carregadas do .env)
 PG_HOST = os.getenv("PG_HOST")
@@ -96,6 +116,110 @@ if not SENHA_ADMIN:
     logger.warning("⚠️ AVISO: SENHA_ADMIN não definida no .env. Admin bloqueado.")
     SENHA_ADMIN = None
 
+# --- CONFIGURAÇÕES DA PIPELINE DE ANÁLISE ---
+# Motor de busca vetorial: "chroma" (PersistentClient) ou "numpy" (índice em memória
+# gerado por indice_vetorial.py / migrate_to_chroma.py em INDICE_NUMPY_DIR).
+BUSCA_BACKEND = os.getenv("BUSCA_BACKEND", "chroma").lower()
+# Só no backend numpy: primeira passada sobre códigos "int8", "binario" ou vetores
+# reduzidos por "pca" e distância exata apenas nos BUSCA_CANDIDATOS melhores
+# (avalie o recall com avaliar_indice.py).
+BUSCA_QUANTIZACAO = os.getenv("BUSCA_QUANTIZACAO", "").lower() or None
+BUSCA_CANDIDATOS = int(os.getenv("BUSCA_CANDIDATOS", "200"))
+
+# ChromaDB: "local" (PersistentClient por worker) ou "http" (um servidor Chroma por host,
+# compartilhado pelos workers do uvicorn: os índices HNSW ficam em memória uma única vez).
+# Servidor: chroma run --path ./chroma_db --host 127.0.0.1 --port 8001
+CHROMA_MODO = os.getenv("CHROMA_MODO", "local").lower()
+CHROMA_HOST = os.getenv("CHROMA_HOST", "127.0.0.1")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
+CHROMA_POOL_TAMANHO = int(os.getenv("CHROMA_POOL_TAMANHO", "4"))
+CHROMA_HEALTHCHECK_S = float(os.getenv("CHROMA_HEALTHCHECK_S", "30"))
+
+# Orçamento de memória das coleções abertas (MB, 0 = sem limite). As menos usadas
+# (ex.: ENSINO, SEGURADORA) saem do cache e são recarregadas no próximo uso.
+COLECOES_MEMORIA_MAX_MB = int(os.getenv("COLECOES_MEMORIA_MAX_MB", "0"))
+
+# Versões das coleções: migrate_to_chroma.py grava AEREO__v7 e aponta o alias AEREO
+# para ela em ALIAS_COLECOES_PATH. A API confere o arquivo a cada COLECOES_ALIAS_CHECK_S
+# (0 = só pelo /api/admin/colecoes/recarregar) e troca a versão sem reiniciar.
+COLECOES_ALIAS_CHECK_S = float(os.getenv("COLECOES_ALIAS_CHECK_S", "10"))
+
+# Busca especulativa: calcula o embedding (e pré-consulta as coleções mais prováveis)
+# enquanto a classificação da LLM ainda está em andamento.
+ANALISE_ESPECULATIVA = os.getenv("ANALISE_ESPECULATIVA", "0") == "1"
+ESPECULATIVA_COLECOES = int(os.getenv("ESPECULATIVA_COLECOES", "2"))
+# Classificador local por centroides das coleções: a LLM só é consultada quando
+# a margem entre as duas melhores categorias é baixa ou o relato está longe de tudo.
+# MARGEM=0.02 e SIM_MIN=0.80 são pontos de partida conservadores, não medidos em relatos
+# rotulados: no e5 textos jurídicos sem relação já ficam em ~0.70-0.78 de cosseno, então
+# 0.80 só corta o que está claramente longe. Para recalibrar, compare os logs 🎯 (aceitos)
+# e 🤔 (enviados à LLM, com a categoria que ela escolheu) e suba/desça os limites.
+CLASSIFICADOR_LOCAL = os.getenv("CLASSIFICADOR_LOCAL", "0") == "1"
+CLASSIFICADOR_LOCAL_MARGEM = float(os.getenv("CLASSIFICADOR_LOCAL_MARGEM", "0.02"))
+CLASSIFICADOR_LOCAL_SIM_MIN = float(os.getenv("CLASSIFICADOR_LOCAL_SIM_MIN", "0.80"))
+# Fora de escopo (trabalhista, família...): não há centroide de OUTROS, então cada categoria
+# tem um mínimo próprio, o percentil PERCENTIL da similaridade das suas decisões com o seu
+# centroide. Relato mais distante que 95% da própria coleção vai para a LLM, que decide OUTROS.
+CLASSIFICADOR_LOCAL_PERCENTIL = float(os.getenv("CLASSIFICADOR_LOCAL_PERCENTIL", "5"))
+# Pré-filtro local de validade: rejeita lixo óbvio (curto, sem sentido, fora do idioma)
+# sem chamar a LLM; só relatos ambíguos seguem para a validação do Gemini.
+VALIDACAO_LOCAL = os.getenv("VALIDACAO_LOCAL", "0") == "1"
+VALIDACAO_MIN_CARACTERES = int(os.getenv("VALIDACAO_MIN_CARACTERES", "30"))
+VALIDACAO_MIN_PALAVRAS = int(os.getenv("VALIDACAO_MIN_PALAVRAS", "6"))
+VALIDACAO_SIM_INVALIDO = float(os.getenv("VALIDACAO_SIM_INVALIDO", "0.72"))
+VALIDACAO_SIM_VALIDO = float(os.getenv("VALIDACAO_SIM_VALIDO", "0.85"))
+# Micro-batching do bi-encoder: junta embeddings de requisições concorrentes num único encode.
+# EMBEDDING_LOTE_ESPERA_MS=0 desliga (batch de 1 por requisição, como antes).
+EMBEDDING_LOTE_MAX = int(os.getenv("EMBEDDING_LOTE_MAX", "16"))
+EMBEDDING_LOTE_ESPERA_MS = float(os.getenv("EMBEDDING_LOTE_ESPERA_MS", "5"))
+# Reranking em lote: pares (relato, decisão) de análises concorrentes são ordenados por
+# tamanho e pontuados juntos em batches de RERANK_BATCH_SIZE (menos padding).
+RERANK_LOTE_MAX = int(os.getenv("RERANK_LOTE_MAX", "8"))
+RERANK_LOTE_ESPERA_MS = float(os.getenv("RERANK_LOTE_ESPERA_MS", "5"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+# Reranking adaptativo: pelas distâncias densas decide quantos dos 20 candidatos vão ao
+# CrossEncoder (os que estão a até RERANK_MARGEM x a faixa de distâncias do 3º colocado,
+# no mínimo RERANK_MIN) e pontua em blocos de RERANK_BLOCO, parando quando o top-3 se repete.
+RERANK_ADAPTATIVO = os.getenv("RERANK_ADAPTATIVO", "0") == "1"
+RERANK_MIN = int(os.getenv("RERANK_MIN", "6"))
+RERANK_BLOCO = int(os.getenv("RERANK_BLOCO", "4"))
+RERANK_MARGEM = float(os.getenv("RERANK_MARGEM", "0.25"))
+# Reranking adiado: a resposta sai logo após a busca (probabilidade e valor não dependem
+# da ordem) com os casos na ordem densa; o CrossEncoder reordena em segundo plano e os
+# casos finais vão para o cache e o lead. Relatório/PDF esperam até RERANK_ADIADO_ESPERA_S.
+RERANK_ADIADO = os.getenv("RERANK_ADIADO", "0") == "1"
+# Pares já tokenizados: o relato é tokenizado uma vez e as decisões vêm de
+# tokens_passagens/ (gerado pelo migrate_to_chroma.py); o padding é por lote ordenado.
+RERANK_TOKENS = os.getenv("RERANK_TOKENS", "0") == "1"
+RERANK_ADIADO_ESPERA_S = float(os.getenv("RERANK_ADIADO_ESPERA_S", "30"))
+# Análise de outro worker ainda provisória no banco: relida a cada RERANK_ADIADO_RELEITURA_S
+RERANK_ADIADO_RELEITURA_S = float(os.getenv("RERANK_ADIADO_RELEITURA_S", "0.5"))
+# Backend de inferência: "torch" (fp32) ou "onnx" (int8 via onnxruntime, gerado por exportar_onnx.py)
+INFERENCIA_BACKEND = os.getenv("INFERENCIA_BACKEND", "torch")
+ONNX_QUANTIZACAO = os.getenv("ONNX_QUANTIZACAO", "avx2")
+# Timeout por chamada de LLM e hedging: se o Gemini não responder em LLM_HEDGE_MS
+# (~p90 dele), o OpenRouter é disparado em paralelo e vale a primeira resposta válida.
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "15"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MS = float(os.getenv("LLM_HEDGE_MS", "2500"))
+# Classificação em lote: relatos que chegam dentro da janela vão juntos num único
+# pedido ao Gemini (lista de ClassificacaoCaso), reduzindo overhead e rate limit em picos.
+CLASSIFICADOR_LOTE = os.getenv("CLASSIFICADOR_LOTE", "0") == "1"
+CLASSIFICADOR_LOTE_MAX = int(os.getenv("CLASSIFICADOR_LOTE_MAX", "8"))
+CLASSIFICADOR_LOTE_ESPERA_MS = float(os.getenv("CLASSIFICADOR_LOTE_ESPERA_MS", "150"))
+# Prompt do classificador: o bloco de categorias vai como system instruction (prefixo fixo,
+# aproveitado pelo cache implícito do Gemini) e o relato é cortado num orçamento de tokens.
+# Cache explícito não se aplica: o bloco (~350 tokens) fica abaixo do mínimo exigido.
+MODELO_CLASSIFICADOR = os.getenv("MODELO_CLASSIFICADOR", "gemini-2.0-flash")
+LLM_ORCAMENTO_TOKENS_RELATO = int(os.getenv("LLM_ORCAMENTO_TOKENS_RELATO", "400"))
+CARACTERES_POR_TOKEN = 4.0
+# Circuit breaker por provedor: abre com taxa de erro >= CIRCUIT_TAXA_ERRO nas últimas
+# CIRCUIT_JANELA chamadas (mín. CIRCUIT_MIN_CHAMADAS) e tenta de novo após CIRCUIT_COOLDOWN_S.
+CIRCUIT_JANELA = int(os.getenv("CIRCUIT_JANELA", "20"))
+CIRCUIT_MIN_CHAMADAS = int(os.getenv("CIRCUIT_MIN_CHAMADAS", "5"))
+CIRCUIT_TAXA_ERRO = float(os.getenv("CIRCUIT_TAXA_ERRO", "0.5"))
+CIRCUIT_COOLDOWN_S = float(os.getenv("CIRCUIT_COOLDOWN_S", "30"))
+
 # --- CONNECTION POOL (POSTGRESQL) ---
 pg_pool = None
 try:
@@ -206,6 +330,13 @@ def enviar_email_pdf(destinatario, nome, pdf_buffer):
 # TTL: 24 horas, Max: 1000 itens
 ANALISES_CACHE = TTLCache(maxsize=1000, ttl=86400)
 
+# Resultados já calculados por relato (hash do texto normalizado): reenvios do mesmo
+# relato (refresh, pagamento falho, "Nova Análise") reaproveitam a pipeline inteira.
+RESULTADOS_CACHE = TTLCache(
+    maxsize=int(os.getenv("RESULTADOS_CACHE_MAX", "2000")),
+    ttl=int(os.getenv("RESULTADOS_CACHE_TTL", "21600"))
+)
+
 # --- MODELOS ---
 class AnaliseRequest(BaseModel):
     relato: str = Field(..., max_length=5000)
@@ -246,11 +377,127 @@ class ClassificacaoCaso(BaseModel):
     valido: bool = Field(description="Se o relato é um caso jurídico válido e tem informações suficientes.")
     razao_invalido: str | None = Field(default=None, description="Explicação curta se não for válido.")
 
+class ClassificacaoLoteItem(ClassificacaoCaso):
+    indice: int = Field(description="Número do relato na lista (começando em 1).")
+
 # --- CARREGAMENTO DE IA ---
 model_bi = None
 model_cross = None
 chroma_client = None
 
+MODELO_BI = "intfloat/multilingual-e5-large"
+MODELO_CROSS = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+def carregar_modelos_nlp():
+    """Carrega bi-encoder e cross-encoder no backend configurado (fallback para torch)."""
+    if INFERENCIA_BACKEND == "onnx":
+        arquivo = f"onnx/model_qint8_{ONNX_QUANTIZACAO}.onnx"
+        dir_bi, dir_cross = ONNX_DIR / "bi_encoder", ONNX_DIR / "cross_encoder"
+        if (dir_bi / arquivo).exists() and (dir_cross / arquivo).exists():
+            paridade_path = ONNX_DIR / "paridade.json"
+            if paridade_path.exists():
+                paridade = json.loads(paridade_path.read_text(encoding="utf-8"))
+                if not paridade.get("aprovado"):
+                    logger.warning(f"⚠️ Modelos ONNX reprovados na paridade com fp32: {paridade}")
+            else:
+                logger.warning("⚠️ Modelos ONNX sem verificação de paridade (rode exportar_onnx.py).")
+
+            try:
+                bi = SentenceTransformer(str(dir_bi), backend="onnx", model_kwargs={"file_name": arquivo})
+                cross = CrossEncoder(str(dir_cross), backend="onnx", model_kwargs={"file_name": arquivo})
+                logger.info(f"✅ Modelos ONNX carregados ({arquivo}).")
+                return bi, cross
+            except Exception as e:
+                # onnxruntime/optimum ausentes, sentence-transformers antigo ou arquivo corrompido
+                logger.error(f"❌ Falha ao carregar os modelos ONNX ({e}). Usando PyTorch fp32.")
+        else:
+            logger.error(f"❌ Modelos ONNX não encontrados em {ONNX_DIR}. Usando PyTorch fp32.")
+
+    return SentenceTransformer(MODELO_BI), CrossEncoder(MODELO_CROSS)
+
+class PoolChroma:
+    """
+    Pool de chromadb.HttpClient para o servidor Chroma local. Expõe get_collection()
+    como o PersistentClient, distribuindo as chamadas entre os clientes (round-robin).
+    Clientes que falham no heartbeat são descartados e recriados no próximo uso.
+    """
+
+    def __init__(self, host, port, tamanho=4):
+        self.host = host
+        self.port = port
+        self.clientes = [None] * max(1, tamanho)
+        self.lock = threading.Lock()
+        self.proximo = 0
+        self.saudavel = False
+        self.ultimo_heartbeat = None
+        self.falhas = 0
+
+    def _slot(self):
+        with self.lock:
+            i = self.proximo
+            self.proximo = (self.proximo + 1) % len(self.clientes)
+            if self.clientes[i] is None:
+                self.clientes[i] = chromadb.HttpClient(host=self.host, port=self.port)
+            return i, self.clientes[i]
+
+    def _descartar(self, i):
+        with self.lock:
+            self.clientes[i] = None
+
+    def get_collection(self, name):
+        i, cliente = self._slot()
+        try:
+            return cliente.get_collection(name=name)
+        except Exception:
+            # Erro de conexão invalida o cliente; "coleção inexistente" só propaga
+            if not self.verificar():
+                self._descartar(i)
+            raise
+
+    def verificar(self):
+        """Heartbeat no servidor. Em falha, descarta todos os clientes do pool."""
+        try:
+            _, cliente = self._slot()
+            cliente.heartbeat()
+            self.saudavel = True
+        except Exception as e:
+            if self.saudavel:
+                logger.error(f"❌ Servidor Chroma em {self.host}:{self.port} não respondeu: {e}")
+            self.saudavel = False
+            self.falhas += 1
+            with self.lock:
+                self.clientes = [None] * len(self.clientes)
+        self.ultimo_heartbeat = time.time()
+        return self.saudavel
+
+    def estatisticas(self):
+        return {
+            "modo": "http",
+            "servidor": f"{self.host}:{self.port}",
+            "saudavel": self.saudavel,
+            "clientes_abertos": sum(1 for c in self.clientes if c is not None),
+            "falhas_heartbeat": self.falhas,
+            "ultimo_heartbeat_s": round(time.time() - self.ultimo_heartbeat, 1) if self.ultimo_heartbeat else None,
+        }
+
+def conectar_chroma():
+    """Abre o ChromaDB conforme CHROMA_MODO (servidor compartilhado ou arquivo local)."""
+    if CHROMA_MODO == "http":
+        pool_chroma = PoolChroma(CHROMA_HOST, CHROMA_PORT, CHROMA_POOL_TAMANHO)
+        if pool_chroma.verificar():
+            logger.info(f"✅ Conectado ao servidor Chroma em {CHROMA_HOST}:{CHROMA_PORT} (pool de {CHROMA_POOL_TAMANHO}).")
+        else:
+            logger.error(f"❌ Servidor Chroma indisponível em {CHROMA_HOST}:{CHROMA_PORT}. Tentando de novo no health check.")
+        return pool_chroma
+
+    settings = Settings()
+    if COLECOES_MEMORIA_MAX_MB > 0:
+        # Sem isso o Chroma mantém todo índice HNSW já aberto em memória, mesmo sem handle
+        settings = Settings(chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=COLECOES_MEMORIA_MAX_MB * 1024 * 1024)
+    cliente = chromadb.PersistentClient(path=str(CHROMA_DB_DIR), settings=settings)
+    logger.info(f"✅ ChromaDB carregado de {CHROMA_DB_DIR}")
+    return cliente
+
 @app.on_event("startup")
 def load_models():
     global model_bi, model_cross, chroma_client
@@ -261,18 +508,220 @@ def load_models():
     logger.info("Carregando modelos de IA e ChromaDB...")
     try:
         # Carrega ChromaDB
-        chroma_client = chromadb.PersistentClient(path=str(CHROMA_DB_DIR))
-        logger.info(f"✅ ChromaDB carregado de {CHROMA_DB_DIR}")
+        chroma_client = conectar_chroma()
+        GERENCIADOR_COLECOES.aliases = ler_aliases() or {}
 
         # Carrega Modelos NLP
-        model_bi = SentenceTransformer("intfloat/multilingual-e5-large")
-        model_cross = CrossEncoder("cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+        model_bi, model_cross = carregar_modelos_nlp()
         logger.info("✅ Modelos de IA carregados.")
+
+        if CLASSIFICADOR_LOCAL or VALIDACAO_LOCAL:
+            construir_centroides()
     except Exception as e: 
         logger.error(f"Erro IA/DB: {e}")
         # Adicionando mais detalhes para debug
         logger.error(f"Detalhes do erro: {traceback.format_exc()}")
 
+# --- EXECUTORES DEDICADOS (PIPELINE ASSÍNCRONA) ---
+# O /api/analisar é async: a espera pelas LLMs não ocupa threads.
+# Só as etapas de CPU (embedding/busca, reranking) e a escrita no Postgres
+# rodam em executores próprios, fora do threadpool padrão do FastAPI.
+EXECUTOR_EMBEDDING = ThreadPoolExecutor(max_workers=int(os.getenv("EXECUTOR_EMBEDDING_WORKERS", "2")), thread_name_prefix="embedding")
+EXECUTOR_RERANK = ThreadPoolExecutor(max_workers=int(os.getenv("EXECUTOR_RERANK_WORKERS", "2")), thread_name_prefix="rerank")
+EXECUTOR_DB = ThreadPoolExecutor(max_workers=int(os.getenv("EXECUTOR_DB_WORKERS", "4")), thread_name_prefix="db")
+
+async def executar_em(executor, func, *args, **kwargs):
+    """Roda uma função bloqueante no executor indicado sem travar o event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+@app.on_event("shutdown")
+def encerrar_executores():
+    for executor in (EXECUTOR_EMBEDDING, EXECUTOR_RERANK, EXECUTOR_DB):
+        executor.shutdown(wait=False)
+
+async def monitorar_chroma():
+    """Health check periódico do servidor Chroma (modo http)."""
+    while True:
+        await asyncio.sleep(CHROMA_HEALTHCHECK_S)
+        if isinstance(chroma_client, PoolChroma):
+            saudavel_antes = chroma_client.saudavel
+            if await executar_em(EXECUTOR_DB, chroma_client.verificar) and not saudavel_antes:
+                logger.info(f"✅ Servidor Chroma em {CHROMA_HOST}:{CHROMA_PORT} voltou a responder.")
+
+@app.on_event("startup")
+async def iniciar_monitor_chroma():
+    if CHROMA_MODO == "http":
+        app.state.monitor_chroma = asyncio.create_task(monitorar_chroma())
+
+async def monitorar_aliases():
+    """Aplica novas versões de coleção assim que o arquivo de aliases muda."""
+    mtime = ALIAS_COLECOES_PATH.stat().st_mtime if ALIAS_COLECOES_PATH.exists() else None
+    while True:
+        await asyncio.sleep(COLECOES_ALIAS_CHECK_S)
+        atual = ALIAS_COLECOES_PATH.stat().st_mtime if ALIAS_COLECOES_PATH.exists() else None
+        if atual == mtime:
+            continue
+        mtime = atual
+        try:
+            await aplicar_novas_versoes()
+        except Exception as e:
+            logger.error(f"❌ Erro trocando versões das coleções: {e}")
+
+@app.on_event("startup")
+async def iniciar_monitor_aliases():
+    if COLECOES_ALIAS_CHECK_S > 0:
+        app.state.monitor_aliases = asyncio.create_task(monitorar_aliases())
+
+# --- PROVEDORES DE LLM (CLIENTES PERSISTENTES + CIRCUIT BREAKER) ---
+class ProvedorIndisponivel(Exception):
+    pass
+
+class ProvedorLLM:
+    """
+    Cliente de longa duração de um provedor de LLM (mantém o pool HTTP/TLS vivo entre
+    requisições) com métricas de latência/erro e circuit breaker:
+    fechado -> aberto (pula o provedor) -> meio_aberto (uma chamada de teste) -> fechado.
+    """
+
+    def __init__(self, nome, criar_cliente):
+        self.nome = nome
+        self._criar_cliente = criar_cliente
+        self._cliente = None
+        self.janela = deque(maxlen=CIRCUIT_JANELA)
+        self.estado = "fechado"
+        self.aberto_ate = 0.0
+        self._sondando = False
+        self.chamadas = 0
+        self.falhas = 0
+        self.latencia_media_ms = None
+        self.tokens_entrada = 0
+        self.tokens_cache = 0
+        self.tokens_saida = 0
+
+    @property
+    def cliente(self):
+        if self._cliente is None:
+            self._cliente = self._criar_cliente()
+        return self._cliente
+
+    def disponivel(self):
+        if self.estado == "aberto":
+            if time.monotonic() < self.aberto_ate:
+                return False
+            self.estado = "meio_aberto"
+            self._sondando = False
+        if self.estado == "meio_aberto":
+            # Só uma chamada de teste por vez
+            if self._sondando:
+                return False
+            self._sondando = True
+        return True
+
+    def registrar_sucesso(self, latencia_s):
+        self.chamadas += 1
+        self.janela.append(True)
+        ms = latencia_s * 1000
+        self.latencia_media_ms = ms if self.latencia_media_ms is None else 0.8 * self.latencia_media_ms + 0.2 * ms
+        if self.estado == "meio_aberto":
+            logger.info(f"✅ Circuit breaker {self.nome}: fechado novamente.")
+            self.janela.clear()
+        self.estado = "fechado"
+        self._sondando = False
+
+    def registrar_falha(self):
+        self.chamadas += 1
+        self.falhas += 1
+        self.janela.append(False)
+        erros = self.janela.count(False)
+        if self.estado == "meio_aberto" or (
+            len(self.janela) >= CIRCUIT_MIN_CHAMADAS and erros / len(self.janela) >= CIRCUIT_TAXA_ERRO
+        ):
+            self._abrir()
+
+    def registrar_tokens(self, entrada, saida, cache=0):
+        self.tokens_entrada += entrada or 0
+        self.tokens_saida += saida or 0
+        self.tokens_cache += cache or 0
+        logger.info(f"🔢 Tokens {self.nome}: entrada={entrada or 0} (cache={cache or 0}), saída={saida or 0}")
+
+    def liberar_sonda(self):
+        # Chamada cancelada (ex.: perdeu o hedge) não conta como sucesso nem falha
+        self._sondando = False
+
+    def _abrir(self):
+        if self.estado != "aberto":
+            logger.warning(f"⚠️ Circuit breaker {self.nome}: aberto por {CIRCUIT_COOLDOWN_S:.0f}s.")
+        self.estado = "aberto"
+        self.aberto_ate = time.monotonic() + CIRCUIT_COOLDOWN_S
+        self._sondando = False
+
+    def estatisticas(self):
+        return {
+            "estado": self.estado,
+            "chamadas": self.chamadas,
+            "falhas": self.falhas,
+            "taxa_erro_janela": round(self.janela.count(False) / len(self.janela), 2) if self.janela else 0,
+            "latencia_media_ms": round(self.latencia_media_ms, 1) if self.latencia_media_ms is not None else None,
+            "tokens_entrada": self.tokens_entrada,
+            "tokens_cache": self.tokens_cache,
+            "tokens_saida": self.tokens_saida,
+            "tokens_entrada_por_chamada": round(self.tokens_entrada / self.chamadas, 1) if self.chamadas else 0
+        }
+
+def _criar_cliente_gemini():
+    return genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+
+def _criar_cliente_openrouter():
+    return AsyncOpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=OPENAI_KEY,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=120)
+        )
+    )
+
+PROVEDORES_LLM = {
+    "gemini": ProvedorLLM("Gemini", _criar_cliente_gemini),
+    "openrouter": ProvedorLLM("OpenRouter", _criar_cliente_openrouter),
+}
+
+def falha_do_provedor(erro):
+    """
+    Só timeout, erro de rede e HTTP 5xx/429 contam para o circuit breaker. Um 4xx
+    (INVALID_ARGUMENT de um áudio corrompido, prompt recusado) é problema da requisição.
+    """
+    if isinstance(erro, (asyncio.TimeoutError, httpx.TransportError, APIConnectionError)):
+        return True
+    # google.genai.errors.APIError expõe `code`; openai.APIStatusError, `status_code`
+    status = getattr(erro, "status_code", None) or getattr(erro, "code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+async def chamar_provedor(nome, chamada, timeout=None):
+    """
+    Executa `chamada(cliente)` no provedor com timeout (padrão LLM_TIMEOUT_S), registrando
+    latência e erros. Levanta ProvedorIndisponivel na hora se o circuit breaker estiver aberto.
+    """
+    provedor = PROVEDORES_LLM[nome]
+    if not provedor.disponivel():
+        raise ProvedorIndisponivel(f"circuit breaker aberto para {provedor.nome}")
+
+    inicio = time.monotonic()
+    try:
+        resultado = await asyncio.wait_for(chamada(provedor.cliente), timeout or LLM_TIMEOUT_S)
+    except asyncio.CancelledError:
+        provedor.liberar_sonda()
+        raise
+    except Exception as e:
+        if falha_do_provedor(e):
+            provedor.registrar_falha()
+        else:
+            provedor.liberar_sonda()
+        raise
+    provedor.registrar_sucesso(time.monotonic() - inicio)
+    return resultado
+
 # --- INIT DB (PostgreSQL) ---
 def init_db():
     conn = get_db_connection()
@@ -330,9 +779,27 @@ def formatar_moeda(valor):
         return f"R$ {float(valor):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
     except: return "R$ 0,00"
 
+# Análises com reordenação dos casos em andamento (id_analise -> threading.Event)
+ANALISES_PENDENTES = {}
+
 def get_analise_data(id_analise):
+    prazo = time.monotonic() + RERANK_ADIADO_ESPERA_S
+    evento = ANALISES_PENDENTES.get(id_analise)
+    if evento is not None and not evento.wait(RERANK_ADIADO_ESPERA_S):
+        logger.warning(f"⚠️ Reordenação dos casos de {id_analise} não terminou. Usando ordem provisória.")
     if id_analise in ANALISES_CACHE: return ANALISES_CACHE[id_analise]
-    
+
+    dados = ler_analise_db(id_analise)
+    # Reordenação rodando em outro worker (ANALISES_PENDENTES é por processo): aguarda pelo banco
+    while dados and dados.get("casos_provisorios") and time.monotonic() < prazo:
+        time.sleep(RERANK_ADIADO_RELEITURA_S)
+        dados = ler_analise_db(id_analise)
+    if dados and dados.get("casos_provisorios"):
+        logger.warning(f"⚠️ Reordenação dos casos de {id_analise} não terminou. Usando ordem provisória.")
+    return dados
+
+def ler_analise_db(id_analise):
+    """Análise gravada no banco (cacheada só quando já tem a ordem final dos casos)."""
     conn = get_db_connection()
     if not conn: return None
     
@@ -345,7 +812,9 @@ def get_analise_data(id_analise):
             try:
                 dados = json.loads(row[0])
                 if row[1]: dados["pago"] = True
-                ANALISES_CACHE[id_analise] = dados
+                # Provisório: outro worker ainda está reordenando; não cacheia
+                if not dados.get("casos_provisorios"):
+                    ANALISES_CACHE[id_analise] = dados
                 return dados
             except Exception as e:
                 logger.error(f"Erro deserializar: {e}")
@@ -472,11 +941,8 @@ async def transcrever_audio(file: UploadFile = File(...)):
         # Lê os bytes do arquivo enviado
         audio_bytes = await file.read()
         
-        # Instancia o cliente (idealmente global, mas aqui garante isolamento de config)
-        client = genai.Client(api_key=GOOGLE_KEY)
-
-        # Envia para o Gemini 2.0 Flash
-        response = client.models.generate_content(
+        # Envia para o Gemini 2.0 Flash (cliente persistente do registro de provedores)
+        response = await chamar_provedor("gemini", lambda client: client.aio.models.generate_content(
             model='gemini-2.0-flash',
             contents=[
                 types.Part.from_bytes(data=audio_bytes, mime_type=file.content_type),
@@ -484,7 +950,7 @@ async def transcrever_audio(file: UploadFile = File(...)):
                 "Se houver gírias ou pausas, limpe o texto para que fique claro e formal, pronto para ser usado em um relato de caso. "
                 "Não adicione comentários, apenas o texto transcrito."
             ]
-        )
+        ), timeout=120)
         
         texto_transcrito = response.text
         logger.info("✅ Transcrição concluída com sucesso.")
@@ -496,16 +962,9 @@ async def transcrever_audio(file: UploadFile = File(...)):
         # Fallback genérico ou erro
         raise HTTPException(status_code=500, detail="Falha ao processar áudio.")
 
-@app.post("/api/analisar")
-def analisar_caso(request: AnaliseRequest):
-    GOOGLE_KEY = os.getenv("GOOGLE_API_KEY")
-    if not GOOGLE_KEY:
-        raise HTTPException(status_code=500, detail="Chave da IA não configurada.")
-
-    client = genai.Client(api_key=GOOGLE_KEY)
-    
-    prompt_text = f"""
-    Analise o seguinte relato e classifique-o na MELHOR categoria jurídica abaixo.
+# --- PIPELINE DE ANÁLISE (ASSÍNCRONA) ---
+INSTRUCOES_CLASSIFICACAO = """
+    Você classifica relatos de consumidores na MELHOR categoria jurídica abaixo.
     
     Categorias Permitidas:
     1. AEREO (Cancelamento/Atraso de voo, Bagagem extraviada)
@@ -525,137 +984,1092 @@ def analisar_caso(request: AnaliseRequest):
     Instruções:
     - Se o texto for muito curto, sem sentido ou não descrever um problema jurídico, marque valido=False.
     - Se for válido, escolha a categoria exata da lista acima.
+    - Trechos marcados com [...] foram omitidos por tamanho; classifique pelo que foi enviado.
+"""
+
+def truncar_relato(relato, max_tokens=None):
+    """
+    Limita o relato ao orçamento de tokens (estimado por caracteres), mantendo o início
+    (o problema) e o fim (o desfecho/pedido) e cortando em limites de frase ou palavra.
+    """
+    max_chars = int((max_tokens or LLM_ORCAMENTO_TOKENS_RELATO) * CARACTERES_POR_TOKEN)
+    texto = " ".join(relato.split())
+    if len(texto) <= max_chars:
+        return texto
+
+    marcador = " [...] "
+    disponivel = max_chars - len(marcador)
+    n_inicio = int(disponivel * 0.7)
+
+    inicio = texto[:n_inicio]
+    fim_frase = inicio.rfind(". ")
+    if fim_frase >= n_inicio * 0.6:
+        inicio = inicio[:fim_frase + 1]
+    elif inicio.rfind(" ") > 0:
+        inicio = inicio[:inicio.rfind(" ")]
+
+    fim = texto[len(texto) - (disponivel - len(inicio)):]
+    inicio_frase = fim.find(". ")
+    if 0 <= inicio_frase <= len(fim) * 0.4:
+        fim = fim[inicio_frase + 2:]
+    elif fim.find(" ") >= 0:
+        fim = fim[fim.find(" ") + 1:]
+
+    return inicio + marcador + fim
+
+def montar_prompt_classificacao(relato):
+    return f"Relato: {truncar_relato(relato)}"
+
+def montar_prompt_lote(relatos):
+    linhas = "\n".join(f"[{n}] {truncar_relato(relato)}" for n, relato in enumerate(relatos, start=1))
+    return (
+        f"Há {len(relatos)} relatos independentes abaixo. Classifique CADA um separadamente e devolva "
+        f"uma lista com exatamente um item por relato, preenchendo \"indice\" com o número dele.\n\n"
+        f"Relatos:\n{linhas}"
+    )
+
+def extrair_classificacao_json(content):
+    """Converte a resposta textual (OpenRouter) em ClassificacaoCaso."""
+    # 1. Remove Markdown Code Blocks se existirem
+    if "```" in content:
+        content = re.sub(r"```(?:json)?\n?|\n?```", "", content)
+    
+    # 2. Encontra o primeiro '{' e o último '}'
+    start = content.find("{")
+    end = content.rfind("}")
     
-    Relato: {request.relato[:2000]}
+    if start != -1 and end != -1:
+        raw_json = content[start : end + 1]
+        data_dict = json.loads(raw_json)
+        return ClassificacaoCaso(**data_dict)
+    raise ValueError("JSON bounds not found")
+
+async def gerar_classificacao_gemini(conteudo, schema):
+    """Chamada estruturada ao Gemini com o bloco de categorias como system_instruction."""
+    config = types.GenerateContentConfig(system_instruction=INSTRUCOES_CLASSIFICACAO, response_mime_type='application/json', response_schema=schema)
+    response = await chamar_provedor("gemini", lambda client: client.aio.models.generate_content(
+        model=MODELO_CLASSIFICADOR,
+        contents=conteudo,
+        config=config
+    ))
+
+    uso = response.usage_metadata
+    if uso is not None:
+        PROVEDORES_LLM["gemini"].registrar_tokens(uso.prompt_token_count, uso.candidates_token_count, uso.cached_content_token_count)
+    return response
+
+async def classificar_gemini(conteudo):
+    response = await gerar_classificacao_gemini(conteudo, ClassificacaoCaso)
+    # Parse automático do Pydantic
+    if response.parsed is None:
+        raise ValueError("Resposta sem JSON válido")
+    return response.parsed
+
+async def classificar_openrouter(conteudo):
+    check = await chamar_provedor("openrouter", lambda client_or: client_or.chat.completions.create(
+        model="google/gemini-2.0-flash-lite-preview-02-05:free", 
+        messages=[
+            {"role": "system", "content": INSTRUCOES_CLASSIFICACAO + "\nResponda APENAS JSON válido, sem markdown, com os campos categoria, valido e razao_invalido."},
+            {"role": "user", "content": conteudo}
+        ], 
+        temperature=0.1
+    ))
+    if check.usage is not None:
+        PROVEDORES_LLM["openrouter"].registrar_tokens(check.usage.prompt_tokens, check.usage.completion_tokens)
+    return extrair_classificacao_json(check.choices[0].message.content)
+
+async def tentar_classificacao(nome, coro):
+    """Executa uma chamada de classificação (já com timeout). Falhas viram None (com log)."""
+    try:
+        return await coro
+    except ProvedorIndisponivel as e:
+        logger.warning(f"⚠️ Pulando {nome}: {e}")
+    except asyncio.TimeoutError:
+        logger.error(f"❌ Falha {nome}: timeout de {LLM_TIMEOUT_S}s")
+    except Exception as e:
+        logger.error(f"❌ Falha {nome}: {e}")
+    return None
+
+async def classificar_com_hedge(conteudo):
+    """
+    Gemini primeiro; se não responder dentro de LLM_HEDGE_MS (ou falhar antes),
+    o OpenRouter corre em paralelo. Vence a primeira classificação válida e a outra é cancelada.
     """
+    loop = asyncio.get_running_loop()
+    prazo = loop.time() + LLM_TIMEOUT_S
+    tarefas = {asyncio.ensure_future(tentar_classificacao("Gemini SDK", classificar_gemini(conteudo))): "Gemini"}
+
+    try:
+        feitas, _ = await asyncio.wait(tarefas, timeout=LLM_HEDGE_MS / 1000)
+        if feitas:
+            resp_obj = feitas.pop().result()
+            if resp_obj:
+                return resp_obj
+            logger.info("🔄 Gemini falhou: tentando OpenRouter (Fallback)...")
+        else:
+            logger.info(f"⏱️ Gemini acima de {LLM_HEDGE_MS:.0f}ms: disparando OpenRouter em paralelo (hedge)...")
+
+        tarefas[asyncio.ensure_future(tentar_classificacao("OpenRouter", classificar_openrouter(conteudo)))] = "OpenRouter"
+        pendentes = {t for t in tarefas if not t.done()}
+        while pendentes:
+            feitas, pendentes = await asyncio.wait(pendentes, timeout=max(prazo - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED)
+            if not feitas:
+                break
+            for tarefa in feitas:
+                resp_obj = tarefa.result()
+                if resp_obj:
+                    logger.info(f"🏁 Classificação entregue pelo {tarefas[tarefa]} (hedge).")
+                    return resp_obj
+        return None
+    finally:
+        for tarefa in tarefas:
+            if not tarefa.done():
+                tarefa.cancel()
 
-    resp_obj = None
+async def classificar_relato_individual(relato):
+    """Classifica o relato via Gemini, com OpenRouter como fallback. Retorna None se ambos falharem."""
+    conteudo = montar_prompt_classificacao(relato)
+
+    if LLM_HEDGE:
+        return await classificar_com_hedge(conteudo)
 
     # TENTATIVA 1: Gemini (Nova Lib com Structured Outputs)
-    try:
-        logger.info("🔄 Solicitando análise ao Gemini (Structured Output)...")
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt_text,
-            config=types.GenerateContentConfig(
-                response_mime_type='application/json',
-                response_schema=ClassificacaoCaso
-            )
-        )
-        # Parse automático do Pydantic
-        resp_obj = response.parsed
-    except Exception as e:
-        logger.error(f"❌ Falha Gemini SDK: {e}")
-        # Fallback manual ou erro direto
+    logger.info("🔄 Solicitando análise ao Gemini (Structured Output)...")
+    resp_obj = await tentar_classificacao("Gemini SDK", classificar_gemini(conteudo))
     
     # Se falhar o SDK novo, tenta o OpenRouter (Fallback)
     if not resp_obj:
-        client_or = OpenAI(base_url="https://openrouter.ai/api/v1", api_key=OPENAI_KEY)
-        try:
-            logger.info("🔄 Tentando OpenRouter (Fallback)...")
-            check = client_or.chat.completions.create(
-                model="google/gemini-2.0-flash-lite-preview-02-05:free", 
-                messages=[{"role": "user", "content": prompt_text + " Responda APENAS JSON válido, sem markdown."}], 
-                temperature=0.1
-            )
-            
-            content = check.choices[0].message.content
-            
-            # 1. Remove Markdown Code Blocks se existirem
-            if "```" in content:
-                content = re.sub(r"```(?:json)?\n?|\n?```", "", content)
-            
-            # 2. Encontra o primeiro '{' e o último '}'
-            start = content.find("{")
-            end = content.rfind("}")
-            
-            if start != -1 and end != -1:
-                raw_json = content[start : end + 1]
-                data_dict = json.loads(raw_json)
-                resp_obj = ClassificacaoCaso(**data_dict)
-            else:
-                raise ValueError("JSON bounds not found")
-                
-        except Exception as e:
-            logger.error(f"❌ Falha OpenRouter: {e}")
+        logger.info("🔄 Tentando OpenRouter (Fallback)...")
+        resp_obj = await tentar_classificacao("OpenRouter", classificar_openrouter(conteudo))
 
-    if not resp_obj:
-        raise HTTPException(status_code=503, detail="IA indisponível no momento.")
+    return resp_obj
 
-    if not resp_obj.valido:
-        msg = resp_obj.razao_invalido or "Relato Inválido ou Curto Demais"
-        raise HTTPException(status_code=400, detail=msg)
-    
-    categoria = resp_obj.categoria
-    
-    # --- BUSCA NO CHROMADB ---
-    if categoria == "OUTROS":
-        return {"erro": "Não tratamos deste caso no momento."}
+async def classificar_gemini_lote(relatos):
+    response = await gerar_classificacao_gemini(montar_prompt_lote(relatos), list[ClassificacaoLoteItem])
+    if response.parsed is None:
+        raise ValueError("Resposta do lote sem JSON válido")
+    return response.parsed
 
+async def _processar_lote_classificacao(relatos):
+    """Um pedido ao Gemini para o lote; itens ausentes/falhos caem na classificação individual."""
+    if len(relatos) == 1:
+        return [await classificar_relato_individual(relatos[0])]
+
+    por_indice = {}
+    try:
+        logger.info(f"🔄 Solicitando ao Gemini classificação em lote de {len(relatos)} relatos...")
+        for item in await classificar_gemini_lote(relatos):
+            por_indice[item.indice] = ClassificacaoCaso(categoria=item.categoria, valido=item.valido, razao_invalido=item.razao_invalido)
+    except ProvedorIndisponivel as e:
+        logger.warning(f"⚠️ Pulando lote no Gemini: {e}")
+    except Exception as e:
+        logger.error(f"❌ Falha Gemini (lote): {e}")
+
+    resultados = [por_indice.get(n) for n in range(1, len(relatos) + 1)]
+    faltantes = [i for i, r in enumerate(resultados) if r is None]
+    if faltantes:
+        individuais = await asyncio.gather(*(classificar_relato_individual(relatos[i]) for i in faltantes))
+        for i, resp_obj in zip(faltantes, individuais):
+            resultados[i] = resp_obj
+    return resultados
+
+BATCHER_CLASSIFICACAO = MicroBatcher("classificacao", _processar_lote_classificacao, CLASSIFICADOR_LOTE_MAX, CLASSIFICADOR_LOTE_ESPERA_MS)
+
+async def classificar_relato(relato):
+    """Classificação pela LLM: em lote com outras requisições (CLASSIFICADOR_LOTE=1) ou individual."""
+    if CLASSIFICADOR_LOTE and CLASSIFICADOR_LOTE_MAX > 1:
+        return await BATCHER_CLASSIFICACAO.submeter(relato)
+    return await classificar_relato_individual(relato)
+
+def abrir_colecao(nome):
+    """Abre a coleção no backend configurado (índice NumPy ou ChromaDB), sem cache. None se não existir."""
+    if BUSCA_BACKEND == "numpy":
+        diretorio = INDICE_NUMPY_DIR / nome
+        if (diretorio / "vetores.npy").exists():
+            try:
+                return IndiceVetorial(diretorio, BUSCA_QUANTIZACAO, BUSCA_CANDIDATOS)
+            except Exception as e:
+                logger.error(f"❌ Índice NumPy de {nome} inválido ({e}). Usando ChromaDB.")
+        else:
+            logger.warning(f"⚠️ Índice NumPy de {nome} não encontrado em {INDICE_NUMPY_DIR}. Usando ChromaDB.")
     try:
-        collection = chroma_client.get_collection(name=categoria)
-    except:
-        # Tenta fallback para LUZ se for CORTE_ESSENCIAL e falhar
-        if categoria == "CORTE_ESSENCIAL":
-            try: collection = chroma_client.get_collection(name="LUZ")
-            except: return {"erro": "Base de dados temporariamente indisponível."}
+        return chroma_client.get_collection(name=nome)
+    except Exception:
+        return None
+
+class GerenciadorColecoes:
+    """
+    Cache LRU dos handles de coleção. A coleção é aberta no primeiro uso e aquecida com
+    uma consulta (carrega o índice em memória antes da primeira requisição real). Acima de
+    `memoria_max_mb` (estimativa: vetores x dimensão x 4 bytes), as menos usadas saem do cache.
+    """
+
+    def __init__(self, abrir, memoria_max_mb=0):
+        self.abrir = abrir
+        self.memoria_max = memoria_max_mb * 1024 * 1024
+        self.colecoes = OrderedDict()
+        self.info = {}
+        self.aliases = {}
+        self.lock = threading.Lock()
+        self.evicoes = 0
+        self.trocas = 0
+
+    def resolver(self, nome):
+        """Nome físico (versão) da coleção lógica. Sem alias, é o próprio nome."""
+        return self.aliases.get(nome, nome)
+
+    def obter(self, nome):
+        with self.lock:
+            if nome in self.colecoes:
+                self.colecoes.move_to_end(nome)
+                self.info[nome]["acertos"] += 1
+                return self.colecoes[nome]
+            fisico = self.resolver(nome)
+
+        collection = self.abrir(fisico)
+        if collection is None:
+            return None
+        memoria, aquecimento_ms = self._aquecer(collection)
+
+        with self.lock:
+            if nome in self.colecoes:
+                # Outra thread carregou (ou uma nova versão entrou) enquanto esta aquecia
+                self.colecoes.move_to_end(nome)
+                self.info[nome]["acertos"] += 1
+                return self.colecoes[nome]
+            self._registrar(nome, fisico, collection, memoria, aquecimento_ms)
+        logger.info(f"✅ Coleção {nome} ({fisico}) carregada ({memoria / 1024**2:.1f} MB, aquecimento {aquecimento_ms:.0f} ms).")
+        return collection
+
+    def trocar_versao(self, nome, fisico):
+        """
+        Abre e aquece a versão `fisico` fora do lock e só então aponta o alias para ela:
+        as requisições em andamento terminam na versão antiga, as novas já usam a nova.
+        Retorna o handle novo, ou None se a versão não existir (o alias não muda).
+        """
+        collection = self.abrir(fisico)
+        if collection is None:
+            return None
+        memoria, aquecimento_ms = self._aquecer(collection)
+        with self.lock:
+            self.aliases[nome] = fisico
+            self.colecoes.pop(nome, None)
+            self._registrar(nome, fisico, collection, memoria, aquecimento_ms)
+            self.trocas += 1
+        logger.info(f"🔄 Coleção {nome} trocada para {fisico} (aquecimento {aquecimento_ms:.0f} ms).")
+        return collection
+
+    def _registrar(self, nome, fisico, collection, memoria, aquecimento_ms):
+        """Coloca o handle no cache (chamar com o lock)."""
+        info = self.info.setdefault(nome, {"acertos": 0, "carregamentos": 0})
+        info["carregamentos"] += 1
+        info["versao"] = fisico
+        info["memoria"] = memoria
+        info["aquecimento_ms"] = aquecimento_ms
+        self.colecoes[nome] = collection
+        self._liberar_memoria(manter=nome)
+
+    def _aquecer(self, collection):
+        inicio = time.perf_counter()
+        amostra = collection.get(include=["embeddings"], limit=1)
+        if len(amostra["ids"]) == 0:
+            return 0, 0.0
+        vetor = np.asarray(amostra["embeddings"][0], dtype=np.float32)
+        collection.query(query_embeddings=[vetor.tolist()], n_results=1, include=["distances"])
+        if isinstance(collection, IndiceVetorial):
+            memoria = collection.memoria()
+        else:
+            memoria = collection.count() * vetor.shape[0] * 4
+        return memoria, (time.perf_counter() - inicio) * 1000
+
+    def _liberar_memoria(self, manter):
+        """Remove as coleções menos usadas até caber no orçamento (chamar com o lock)."""
+        if self.memoria_max <= 0:
+            return
+        while self.memoria_total() > self.memoria_max and len(self.colecoes) > 1:
+            nome = next(n for n in self.colecoes if n != manter)
+            del self.colecoes[nome]
+            self.evicoes += 1
+            logger.info(f"♻️ Coleção {nome} liberada da memória (orçamento de {self.memoria_max / 1024**2:.0f} MB).")
+
+    def memoria_total(self):
+        return sum(self.info[n]["memoria"] for n in self.colecoes)
+
+    def estatisticas(self):
+        with self.lock:
+            return {
+                "memoria_mb": round(self.memoria_total() / 1024**2, 1),
+                "memoria_max_mb": round(self.memoria_max / 1024**2, 1) if self.memoria_max > 0 else None,
+                "evicoes": self.evicoes,
+                "trocas_de_versao": self.trocas,
+                "colecoes": {
+                    nome: {
+                        "versao": info["versao"],
+                        "residente": nome in self.colecoes,
+                        "memoria_mb": round(info["memoria"] / 1024**2, 1),
+                        "acertos": info["acertos"],
+                        "carregamentos": info["carregamentos"],
+                        "aquecimento_ms": round(info["aquecimento_ms"], 1),
+                    }
+                    for nome, info in self.info.items()
+                },
+            }
+
+GERENCIADOR_COLECOES = GerenciadorColecoes(abrir_colecao, COLECOES_MEMORIA_MAX_MB)
+
+def obter_colecao(categoria):
+    """Recupera a coleção da categoria pelo gerenciador. Retorna None se indisponível."""
+    collection = GERENCIADOR_COLECOES.obter(categoria)
+    # Tenta fallback para LUZ se for CORTE_ESSENCIAL e falhar
+    if collection is None and categoria == "CORTE_ESSENCIAL":
+        collection = GERENCIADOR_COLECOES.obter("LUZ")
+    return collection
+
+def ler_aliases():
+    """Mapa coleção lógica -> versão física gravado pelo migrate_to_chroma.py."""
+    if not ALIAS_COLECOES_PATH.exists():
+        return {}
+    try:
+        return json.loads(ALIAS_COLECOES_PATH.read_text(encoding="utf-8"))
+    except Exception as e:
+        # Arquivo é trocado atomicamente (os.replace); erro aqui é arquivo editado à mão
+        logger.error(f"❌ Erro lendo {ALIAS_COLECOES_PATH}: {e}")
+        return None
+
+def recarregar_colecoes():
+    """
+    Aplica as versões novas do arquivo de aliases: aquece cada uma, troca atomicamente,
+    recalcula o centroide da categoria e solta os textos/tokens da versão substituída.
+    Roda no EXECUTOR_DB (bloqueante).
+    Retorna {coleção: versão} das que foram trocadas.
+    """
+    aliases = ler_aliases()
+    if aliases is None:
+        return {}
+    trocadas = {}
+    for nome, fisico in aliases.items():
+        antigo = GERENCIADOR_COLECOES.resolver(nome)
+        if antigo == fisico:
+            continue
+        collection = GERENCIADOR_COLECOES.trocar_versao(nome, fisico)
+        if collection is None:
+            logger.error(f"❌ Versão {fisico} da coleção {nome} não encontrada. Mantendo {antigo}.")
+            continue
+        trocadas[nome] = fisico
+        # Requisições em andamento mantêm a própria referência; o memory-map fecha com a última
+        TEXTOS_CARREGADOS.pop(antigo, None)
+        TOKENS_CARREGADOS.pop(antigo, None)
+        if CLASSIFICADOR_LOCAL or VALIDACAO_LOCAL:
+            atualizar_centroide(nome, collection)
+    return trocadas
+
+async def aplicar_novas_versoes():
+    """
+    Troca as versões fora do event loop e, de volta nele, descarta os resultados
+    memorizados das categorias trocadas (o TTLCache não é thread-safe).
+    """
+    trocadas = await executar_em(EXECUTOR_DB, recarregar_colecoes)
+    if trocadas:
+        for chave, resultado in list(RESULTADOS_CACHE.items()):
+            if resultado.get("categoria") in trocadas:
+                RESULTADOS_CACHE.pop(chave, None)
+    return trocadas
+
+TEXTOS_CARREGADOS = {}
+
+def obter_textos_decisoes(colecao):
+    """Textos (passagem, resumo, link) da versão da coleção fora do Chroma, ou None (coleção antiga)."""
+    if colecao not in TEXTOS_CARREGADOS:
+        diretorio = TEXTOS_DECISOES_DIR / colecao
+        TEXTOS_CARREGADOS[colecao] = TextosDecisoes(diretorio) if (diretorio / "meta.json").exists() else None
+    return TEXTOS_CARREGADOS[colecao]
+
+def consultar_colecao(categoria, vetor_query):
+    """Busca os 20 vizinhos mais próximos na coleção da categoria. Retorna None se indisponível."""
+    collection = obter_colecao(categoria)
+    if collection is None:
+        return None
+    # Com os textos fora do Chroma, a busca devolve só ids, distâncias e metadados curtos
+    if obter_textos_decisoes(collection.name) is not None:
+        include = ["metadatas", "distances"]
+    else:
+        include = ["metadatas", "documents", "distances"]
+    results = collection.query(query_embeddings=vetor_query, n_results=20, include=include)
+    # Versão física consultada: os ids só identificam a decisão dentro dela
+    results["colecao"] = collection.name
+    return results
+
+def gerar_embedding_consulta(relato):
+    return model_bi.encode([f"query: {relato}"]).tolist()
+
+def gerar_embeddings_lote(relatos):
+    return model_bi.encode([f"query: {r}" for r in relatos], batch_size=len(relatos)).tolist()
+
+async def _processar_lote_embedding(relatos):
+    return await executar_em(EXECUTOR_EMBEDDING, gerar_embeddings_lote, relatos)
+
+BATCHER_EMBEDDING = MicroBatcher("embedding", _processar_lote_embedding, EMBEDDING_LOTE_MAX, EMBEDDING_LOTE_ESPERA_MS)
+
+async def embedding_consulta(relato):
+    """Embedding do relato no formato aceito pelo ChromaDB ([vetor])."""
+    if EMBEDDING_LOTE_ESPERA_MS > 0 and EMBEDDING_LOTE_MAX > 1:
+        return [await BATCHER_EMBEDDING.submeter(relato)]
+    return await executar_em(EXECUTOR_EMBEDDING, gerar_embedding_consulta, relato)
+
+# --- VALIDAÇÃO LOCAL (PRÉ-FILTRO) ---
+# Palavras funcionais do português: relatos reais sempre contêm algumas
+STOPWORDS_PT = {
+    "a", "o", "as", "os", "de", "do", "da", "dos", "das", "em", "no", "na", "nos", "nas", "um", "uma",
+    "e", "que", "para", "pra", "com", "por", "pelo", "pela", "se", "não", "nao", "mas", "foi", "ao",
+    "eu", "me", "meu", "minha", "ele", "ela", "eles", "isso", "esse", "essa", "já", "ja", "mais",
+    "como", "quando", "tem", "tinha", "sem", "até", "ate", "após", "apos", "depois", "só", "so"
+}
+REGEX_PALAVRA = re.compile(r"[a-zA-ZÀ-ÿ]+")
+# Só letras (sem "k" de risada): "!!!!!!", "1000000" e protocolos são texto legítimo
+REGEX_REPETICAO = re.compile(r"([a-jl-zà-ÿ])\1{5,}", re.IGNORECASE)
+
+def validar_relato_heuristico(relato):
+    """
+    Filtro barato (microssegundos) para lixo óbvio.
+    Retorna o motivo da rejeição ou None se o relato passar.
+    """
+    texto = relato.strip()
+    palavras = REGEX_PALAVRA.findall(texto.lower())
+
+    if len(texto) < VALIDACAO_MIN_CARACTERES or len(palavras) < VALIDACAO_MIN_PALAVRAS:
+        return "Relato muito curto. Descreva com mais detalhes o que aconteceu."
+
+    sem_espacos = re.sub(r"\s", "", texto)
+    letras = sum(len(p) for p in palavras)
+    # Limite baixo: relatos reais podem ter muitos números (valores, datas, protocolos)
+    if letras / max(len(sem_espacos), 1) < 0.4 or REGEX_REPETICAO.search(texto):
+        return "Relato Inválido ou Curto Demais"
+
+    # Sem nenhuma palavra funcional do português: texto aleatório ou em outro idioma
+    funcionais = sum(1 for p in palavras if p in STOPWORDS_PT)
+    if funcionais / len(palavras) < 0.05:
+        return "Não conseguimos entender o relato. Escreva em português descrevendo o problema."
+
+    # Palavras sem vogal em excesso indicam teclado aleatório ("asdfg qwrt")
+    sem_vogal = sum(1 for p in palavras if len(p) > 2 and not re.search(r"[aeiouáéíóúâêôãõà]", p))
+    if sem_vogal / len(palavras) > 0.3:
+        return "Relato Inválido ou Curto Demais"
+
+    return None
+
+def similaridade_vizinho_mais_proximo(categoria, vetor_query):
+    """Cosseno entre o relato e a decisão mais próxima da coleção. Retorna None se indisponível."""
+    collection = obter_colecao(categoria)
+    if collection is None:
+        return None
+    res = collection.query(query_embeddings=vetor_query, n_results=1, include=["embeddings"])
+    vizinhos = res.get("embeddings")
+    if vizinhos is None or len(vizinhos[0]) == 0:
+        return None
+
+    v = np.asarray(vizinhos[0][0], dtype=np.float32)
+    q = np.asarray(vetor_query[0], dtype=np.float32)
+    return float(v @ q / (np.linalg.norm(v) * np.linalg.norm(q) + 1e-12))
+
+async def avaliar_validade_embedding(vetor_query, local):
+    """
+    Compara o relato com a jurisprudência mais próxima (na categoria de centroide mais parecido).
+    Retorna "valido", "invalido" ou "ambiguo" (este último segue para a LLM).
+    """
+    if local is None:
+        return "ambiguo"
+    sim = await executar_em(EXECUTOR_EMBEDDING, similaridade_vizinho_mais_proximo, local["categoria"], vetor_query)
+    if sim is None:
+        return "ambiguo"
+    if sim < VALIDACAO_SIM_INVALIDO:
+        return "invalido"
+    if sim >= VALIDACAO_SIM_VALIDO:
+        return "valido"
+    return "ambiguo"
+
+# --- CLASSIFICADOR LOCAL (CENTROIDES) ---
+# Mesmas categorias de INSTRUCOES_CLASSIFICACAO (exceto OUTROS); o nome é o da coleção no ChromaDB.
+CATEGORIAS_JURIDICAS = [
+    "AEREO", "FRAUDE_PIX", "BLOQUEIO_BANCARIO", "CORTE_ESSENCIAL", "NOME_SUJO", "TELEFONIA",
+    "PLANO_SAUDE", "IMOBILIARIO", "SEGURADORA", "REDES_SOCIAIS", "ECOMMERCE", "ENSINO"
+]
+
+# (nomes, matriz normalizada, similaridades mínimas) — trocados juntos numa única atribuição
+CENTROIDES = None
+
+def paginas_vetores(collection, lote=1000):
+    """Vetores normalizados da coleção, em páginas para não estourar memória."""
+    offset = 0
+    while True:
+        dados = collection.get(include=["embeddings"], limit=lote, offset=offset)
+        vetores = np.asarray(dados["embeddings"], dtype=np.float32)
+        if len(vetores) == 0:
+            return
+        vetores /= np.linalg.norm(vetores, axis=1, keepdims=True) + 1e-12
+        yield vetores
+        offset += lote
+
+def calcular_centroide(collection):
+    """
+    Média dos vetores normalizados da coleção e a similaridade mínima de escopo
+    (percentil CLASSIFICADOR_LOCAL_PERCENTIL das decisões da coleção com o centroide).
+    Retorna (centroide, limiar) ou (None, None) se a coleção estiver vazia.
+    """
+    soma = None
+    for vetores in paginas_vetores(collection):
+        soma = vetores.sum(axis=0) if soma is None else soma + vetores.sum(axis=0)
+    if soma is None:
+        return None, None
+    centroide = soma / (np.linalg.norm(soma) + 1e-12)
+    # Segunda passada: as decisões são "passage:" e o relato é "query:" no e5, que dá
+    # cossenos um pouco menores; o erro é para o lado seguro (mais casos vão à LLM).
+    sims = np.concatenate([vetores @ centroide for vetores in paginas_vetores(collection)])
+    return centroide, float(np.percentile(sims, CLASSIFICADOR_LOCAL_PERCENTIL))
+
+def construir_centroides():
+    global CENTROIDES
+    nomes, vetores, limiares = [], [], []
+    for categoria in CATEGORIAS_JURIDICAS:
+        # Direto, sem o gerenciador: ler os vetores não conta como uso da coleção
+        collection = abrir_colecao(GERENCIADOR_COLECOES.resolver(categoria))
+        if collection is None and categoria == "CORTE_ESSENCIAL":
+            collection = abrir_colecao(GERENCIADOR_COLECOES.resolver("LUZ"))
+        if collection is None:
+            logger.warning(f"⚠️ Classificador local: coleção {categoria} indisponível.")
+            continue
+        centroide, limiar = calcular_centroide(collection)
+        if centroide is not None:
+            nomes.append(categoria)
+            vetores.append(centroide)
+            limiares.append(limiar)
+
+    CENTROIDES = (nomes, np.vstack(vetores), np.asarray(limiares)) if vetores else None
+    logger.info(f"✅ Classificador local: {len(nomes)} centroides carregados.")
+
+def atualizar_centroide(categoria, collection):
+    """Recalcula o centroide de uma categoria após a troca de versão da coleção."""
+    global CENTROIDES
+    if categoria not in CATEGORIAS_JURIDICAS:
+        return
+    centroide, limiar = calcular_centroide(collection)
+    if centroide is None:
+        return
+    if CENTROIDES is None:
+        CENTROIDES = ([categoria], centroide[None, :], np.asarray([limiar]))
+        return
+    nomes, matriz, limiares = CENTROIDES
+    nomes, matriz, limiares = list(nomes), matriz.copy(), limiares.copy()
+    if categoria in nomes:
+        matriz[nomes.index(categoria)] = centroide
+        limiares[nomes.index(categoria)] = limiar
+    else:
+        nomes.append(categoria)
+        matriz = np.vstack([matriz, centroide])
+        limiares = np.append(limiares, limiar)
+    # Troca da tupla inteira: quem está classificando vê a versão antiga ou a nova
+    CENTROIDES = (nomes, matriz, limiares)
+
+def classificar_local(vetor_query):
+    """
+    Similaridade de cosseno do relato com o centroide de cada categoria.
+    Retorna {"categoria", "similaridade", "margem", "limiar", "ranking"} ou None se não houver centroides.
+    """
+    centroides = CENTROIDES
+    if centroides is None:
+        return None
+    nomes, matriz, limiares = centroides
+
+    q = np.asarray(vetor_query[0], dtype=np.float32)
+    q = q / (np.linalg.norm(q) + 1e-12)
+    sims = matriz @ q
+    ordem = np.argsort(-sims)
+
+    sim1 = float(sims[ordem[0]])
+    sim2 = float(sims[ordem[1]]) if len(ordem) > 1 else -1.0
+    return {
+        "categoria": nomes[ordem[0]],
+        "similaridade": sim1,
+        "margem": sim1 - sim2,
+        "limiar": float(limiares[ordem[0]]),
+        "ranking": [nomes[i] for i in ordem]
+    }
+
+def decisao_local_confiavel(local, validade=None):
+    """
+    A categoria local é aceita se a margem for suficiente, o relato estiver no escopo da
+    categoria (similaridade acima do limiar calibrado dela) e for válido.
+    Sem o pré-filtro (validade=None), a similaridade mínima com o centroide faz esse papel.
+    """
+    if local is None or local["margem"] < CLASSIFICADOR_LOCAL_MARGEM:
+        return False
+    # Sem centroide de OUTROS: relato trabalhista/família cai perto de alguma categoria,
+    # mas abaixo do que as decisões dela costumam ficar
+    if local["similaridade"] < local["limiar"]:
+        return False
+    if validade is not None:
+        return validade == "valido"
+    return local["similaridade"] >= CLASSIFICADOR_LOCAL_SIM_MIN
+
+TOKENS_CARREGADOS = {}
+
+def obter_tokens_passagens(colecao):
+    """Passagens pré-tokenizadas da versão da coleção (None se não geradas ou de outro modelo)."""
+    if colecao not in TOKENS_CARREGADOS:
+        tokens = None
+        if (TOKENS_PASSAGENS_DIR / colecao / "tokens.npy").exists():
+            tokens = TokensPassagens(TOKENS_PASSAGENS_DIR / colecao)
+            if tokens.modelo != MODELO_CROSS:
+                logger.warning(f"⚠️ Tokens de {colecao} gerados para {tokens.modelo}. Tokenizando na hora.")
+                tokens = None
+        TOKENS_CARREGADOS[colecao] = tokens
+    return TOKENS_CARREGADOS[colecao]
+
+def tokenizar_pares(relato, documentos, ids, colecao):
+    """Pares (ids do relato, ids da decisão): relato tokenizado uma vez, decisões do arquivo."""
+    tokenizer = model_cross.tokenizer
+    tokens_relato = tokenizer(relato, add_special_tokens=False)["input_ids"]
+    armazenadas = obter_tokens_passagens(colecao) if colecao else None
+    pares = []
+    for doc_id, documento in zip(ids, documentos):
+        tokens_doc = armazenadas.obter(doc_id) if armazenadas is not None else None
+        if tokens_doc is None:
+            tokens_doc = tokenizer(texto_passagem(documento), add_special_tokens=False)["input_ids"]
+        pares.append((tokens_relato, tokens_doc))
+    return pares
+
+def truncar_par(a, b, limite):
+    """Mesmo corte "longest_first" do tokenizer: iguala os tamanhos e divide o resto."""
+    excesso = len(a) + len(b) - limite
+    if excesso <= 0:
+        return a, b
+    diferenca = min(abs(len(a) - len(b)), excesso)
+    if len(a) > len(b):
+        a = a[:len(a) - diferenca]
+    else:
+        b = b[:len(b) - diferenca]
+    resto = excesso - diferenca
+    return a[:len(a) - resto // 2], b[:len(b) - (resto - resto // 2)]
+
+def prever_tokens(pares):
+    """Scores do CrossEncoder para pares já tokenizados (em ordem de tamanho), sem tokenizar texto."""
+    tokenizer = model_cross.tokenizer
+    limite = (getattr(model_cross, "max_length", None) or tokenizer.model_max_length) - tokenizer.num_special_tokens_to_add(pair=True)
+    entradas = [{"input_ids": tokenizer.build_inputs_with_special_tokens(*truncar_par(a, b, limite))} for a, b in pares]
+    ativacao = getattr(model_cross, "activation_fn", None) or getattr(model_cross, "default_activation_function", None)
+
+    scores = []
+    for inicio in range(0, len(entradas), RERANK_BATCH_SIZE):
+        # Padding só até o maior par do lote (os pares chegam ordenados por tamanho)
+        lote = tokenizer.pad(entradas[inicio:inicio + RERANK_BATCH_SIZE], return_tensors="pt")
+        lote = {k: v.to(model_cross.model.device) for k, v in lote.items()}
+        with torch.inference_mode():
+            logits = model_cross.model(**lote).logits
+        if ativacao is not None:
+            logits = ativacao(logits)
+        scores.append(logits.float().cpu().numpy().reshape(len(lote["input_ids"]), -1)[:, 0])
+    return np.concatenate(scores)
+
+def pontuar_pares_lote(grupos_pares):
+    """
+    Pontua pares de várias análises num único predict. Os pares são ordenados por
+    tamanho para que cada batch interno tenha textos parecidos (menos padding) e
+    os scores voltam na ordem original, um array por análise. Pares de ids de token
+    (RERANK_TOKENS) vão direto para o modelo.
+    """
+    pares = [par for grupo in grupos_pares for par in grupo]
+    ordem = sorted(range(len(pares)), key=lambda i: len(pares[i][0]) + len(pares[i][1]))
+    if isinstance(pares[ordem[0]][0], str):
+        scores_ordenados = model_cross.predict([pares[i] for i in ordem], batch_size=RERANK_BATCH_SIZE)
+    else:
+        scores_ordenados = prever_tokens([pares[i] for i in ordem])
+
+    scores = np.empty(len(pares), dtype=np.float32)
+    scores[ordem] = scores_ordenados
+
+    resultados, inicio = [], 0
+    for grupo in grupos_pares:
+        resultados.append(scores[inicio:inicio + len(grupo)])
+        inicio += len(grupo)
+    return resultados
+
+async def _processar_lote_rerank(grupos_pares):
+    return await executar_em(EXECUTOR_RERANK, pontuar_pares_lote, grupos_pares)
+
+BATCHER_RERANK = MicroBatcher("rerank", _processar_lote_rerank, RERANK_LOTE_MAX, RERANK_LOTE_ESPERA_MS)
+
+async def pontuar_pares(pares):
+    """Scores do CrossEncoder para os pares (relato, decisão) de uma análise."""
+    if not pares:
+        return np.empty(0, dtype=np.float32)
+    if RERANK_LOTE_ESPERA_MS > 0 and RERANK_LOTE_MAX > 1:
+        return await BATCHER_RERANK.submeter(pares)
+    return (await executar_em(EXECUTOR_RERANK, pontuar_pares_lote, [pares]))[0]
+
+RERANK_ESTATISTICAS = {"analises": 0, "pares_candidatos": 0, "pares_pontuados": 0, "paradas_antecipadas": 0}
+
+def limite_rerank(distancias):
+    """Quantos candidatos (na ordem densa) podem mudar o top-3 segundo as distâncias."""
+    n = len(distancias)
+    if n <= RERANK_MIN:
+        return n
+    d = np.asarray(distancias, dtype=np.float32)
+    faixa = d[-1] - d[0]
+    if faixa <= 0:
+        return n
+    corte = d[2] + RERANK_MARGEM * faixa
+    return max(RERANK_MIN, int(np.searchsorted(d, corte, side="right")))
+
+async def reranquear(pares, distancias=None):
+    """
+    Scores do CrossEncoder para os candidatos (em ordem densa). No modo adaptativo só
+    os que podem entrar no top-3 são pontuados; os demais ficam com -inf e mantêm a
+    ordem densa atrás dos pontuados.
+    """
+    if not RERANK_ADAPTATIVO or not distancias or len(pares) <= RERANK_MIN:
+        return await pontuar_pares(pares)
+
+    limite = limite_rerank(distancias)
+    scores = np.full(len(pares), -np.inf, dtype=np.float32)
+    pontuados, top3 = 0, None
+    while pontuados < limite:
+        fim = min(RERANK_MIN if pontuados == 0 else pontuados + RERANK_BLOCO, limite)
+        scores[pontuados:fim] = await pontuar_pares(pares[pontuados:fim])
+        pontuados = fim
+        atual = tuple(np.argsort(-scores[:pontuados], kind="stable")[:3])
+        if atual == top3:
+            if pontuados < limite:
+                RERANK_ESTATISTICAS["paradas_antecipadas"] += 1
+            break
+        top3 = atual
+
+    RERANK_ESTATISTICAS["analises"] += 1
+    RERANK_ESTATISTICAS["pares_candidatos"] += len(pares)
+    RERANK_ESTATISTICAS["pares_pontuados"] += pontuados
+    return scores
+
+# Frequência das categorias já classificadas (prior para a busca especulativa)
+CATEGORIAS_FREQUENCIA = Counter()
+
+def _descartar_resultado(tarefa):
+    # Evita "Task exception was never retrieved" em tarefas especulativas descartadas
+    if not tarefa.cancelled():
+        tarefa.exception()
+
+def iniciar_embedding(relato):
+    """Dispara o embedding da consulta em background (ele não depende da categoria)."""
+    tarefa_embedding = asyncio.ensure_future(embedding_consulta(relato))
+    tarefa_embedding.add_done_callback(_descartar_resultado)
+    return tarefa_embedding
+
+def iniciar_preconsultas(categorias, tarefa_embedding):
+    """
+    Pré-consulta as coleções mais prováveis enquanto a LLM classifica o relato.
+    Retorna {categoria: tarefa_consulta}.
+    """
+    async def preconsultar(categoria):
+        vetor_query = await tarefa_embedding
+        return await executar_em(EXECUTOR_EMBEDDING, consultar_colecao, categoria, vetor_query)
+
+    preconsultas = {}
+    for categoria in categorias:
+        preconsultas[categoria] = asyncio.ensure_future(preconsultar(categoria))
+        preconsultas[categoria].add_done_callback(_descartar_resultado)
+    return preconsultas
+
+def desfecho(meta):
+    """(vitoria, valor) gravados na migração; coleções antigas caem na regra sobre o texto."""
+    if "vitoria" in meta:
+        return bool(meta["vitoria"]), float(meta.get("valor", 0))
+    return classificar_desfecho(meta.get("resultado", ""), meta.get("valor_total", 0))
+
+def classificar_resultado(meta):
+    """Retorna ("VITORIA" | "DERROTA", valor) a partir dos metadados da decisão."""
+    vitoria, val = desfecho(meta)
+    return ("VITORIA" if vitoria else "DERROTA"), val
+
+def desfechos_tipados(metadatas, numericos=None):
+    """
+    Arrays (vitorias, valores) dos candidatos: direto do índice NumPy (`numericos`), dos
+    metadados tipados ou, em coleções antigas sem eles, pela regra sobre o texto.
+    """
+    if numericos is not None and "valor" in numericos:
+        return numericos["vitoria"].astype(bool), numericos["valor"].astype(np.float64)
+    n = len(metadatas)
+    if all("vitoria" in m for m in metadatas):
+        vitorias = np.fromiter((m["vitoria"] for m in metadatas), dtype=bool, count=n)
+        valores = np.fromiter((m.get("valor", 0) or 0 for m in metadatas), dtype=np.float64, count=n)
+        return vitorias, valores
+    vitorias, valores = zip(*(desfecho(m) for m in metadatas))
+    return np.asarray(vitorias, dtype=bool), np.asarray(valores, dtype=np.float64)
+
+def calcular_estatisticas(metadatas, numericos=None):
+    """Probabilidade de êxito e valor médio das vitórias (não depende da ordem do reranking)."""
+    if not metadatas:
+        return 0.0, 0
+    vitorias, valores = desfechos_tipados(metadatas, numericos)
+
+    n_vitorias = int(vitorias.sum())
+    prob = min((n_vitorias / 20) * 100, 95.0)
+    val_medio = float(valores[vitorias].mean()) if n_vitorias > 0 else 0
+    return prob, val_medio
+
+def ordenar_casos(candidatos, scores, n=3):
+    """
+    Os `n` casos do relatório, do maior para o menor score do CrossEncoder.
+    Resumo e link vêm dos textos das decisões (só destes casos) ou dos metadados.
+    """
+    finais = []
+    for idx, score in sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:n]:
+        meta = candidatos[idx]['meta']
+        textos = obter_textos_decisoes(candidatos[idx]['colecao']) if candidatos[idx]['colecao'] else None
+        if textos is not None:
+            resumo = textos.obter(candidatos[idx]['id'], "resumo")
+            link = textos.obter(candidatos[idx]['id'], "link") or "#"
         else:
-            return {"erro": "Base de dados temporariamente indisponível."}
+            resumo, link = meta.get("resumo", ""), meta.get("link", "#")
+        tipo, val = classificar_resultado(meta)
+        finais.append({
+            "resumo": resumo,
+            "valor": val,
+            "data": meta.get("data_julgamento", ""),
+            "link": link,
+            "tipo_resultado": tipo
+        })
+    return finais
+
+async def notificar(progresso, evento, dados):
+    """Avisa o consumidor de progresso (streaming SSE) que uma etapa terminou."""
+    if progresso is not None:
+        await progresso(evento, dados)
 
-    # Embed e Busca
-    vetor_query = model_bi.encode([f"query: {request.relato}"]).tolist()
-    results = collection.query(query_embeddings=vetor_query, n_results=20)
+async def processar_analise(relato, progresso=None):
+    """
+    Executa a pipeline completa sem persistir nada:
+    classificação (local ou LLM) -> embedding -> busca no ChromaDB -> reranking -> jurimetria.
+    Retorna o resultado da análise ou {"erro": ...} para casos não atendidos.
+    `progresso(evento, dados)`, se informado, é chamado ao fim de cada etapa.
+    """
+    # Pré-filtro de lixo óbvio antes de gastar qualquer CPU/LLM
+    if VALIDACAO_LOCAL:
+        motivo = validar_relato_heuristico(relato)
+        if motivo:
+            logger.info(f"🚫 Relato rejeitado pelo pré-filtro local: {motivo}")
+            raise HTTPException(status_code=400, detail=motivo)
+
+    classificador_local = CLASSIFICADOR_LOCAL and CENTROIDES is not None
+    validacao_embedding = VALIDACAO_LOCAL and CENTROIDES is not None
+    tarefa_embedding, preconsultas = None, {}
+    if ANALISE_ESPECULATIVA or classificador_local or validacao_embedding:
+        tarefa_embedding = iniciar_embedding(relato)
+    if ANALISE_ESPECULATIVA and not classificador_local:
+        categorias_provaveis = [c for c, _ in CATEGORIAS_FREQUENCIA.most_common(ESPECULATIVA_COLECOES)]
+        preconsultas = iniciar_preconsultas(categorias_provaveis, tarefa_embedding)
 
-    # Reranking com CrossEncoder
+    try:
+        resp_obj, local = None, None
+        if classificador_local or validacao_embedding:
+            vetor_query = await tarefa_embedding
+            local = classificar_local(vetor_query)
+
+            validade = None
+            if validacao_embedding:
+                validade = await avaliar_validade_embedding(vetor_query, local)
+                if validade == "invalido":
+                    logger.info("🚫 Relato rejeitado pelo pré-filtro local: distante de toda a jurisprudência.")
+                    raise HTTPException(status_code=400, detail="O relato não parece descrever um problema jurídico. Conte o que aconteceu com mais detalhes.")
+
+            if classificador_local and decisao_local_confiavel(local, validade):
+                logger.info(f"🎯 Classificação local: {local['categoria']} (sim={local['similaridade']:.3f}, margem={local['margem']:.3f})")
+                resp_obj = ClassificacaoCaso(categoria=local["categoria"], valido=True)
+            elif classificador_local and ANALISE_ESPECULATIVA and local is not None:
+                # As categorias empatadas no centroide são as candidatas mais prováveis da LLM
+                preconsultas = iniciar_preconsultas(local["ranking"][:ESPECULATIVA_COLECOES], tarefa_embedding)
+
+        if resp_obj is None:
+            resp_obj = await classificar_relato(relato)
+            if classificador_local and local is not None and resp_obj:
+                logger.info(f"🤔 Classificação local incerta: {local['categoria']} (sim={local['similaridade']:.3f}, limiar={local['limiar']:.3f}, margem={local['margem']:.3f}); LLM: {resp_obj.categoria}")
+
+        if not resp_obj:
+            raise HTTPException(status_code=503, detail="IA indisponível no momento.")
+
+        if not resp_obj.valido:
+            msg = resp_obj.razao_invalido or "Relato Inválido ou Curto Demais"
+            raise HTTPException(status_code=400, detail=msg)
+        
+        categoria = resp_obj.categoria
+        
+        # --- BUSCA NO CHROMADB ---
+        if categoria == "OUTROS":
+            return {"erro": "Não tratamos deste caso no momento."}
+        CATEGORIAS_FREQUENCIA[categoria] += 1
+        await notificar(progresso, "categoria", {"categoria": categoria})
+
+        # Embed e Busca (reaproveita o trabalho especulativo, se houver)
+        if tarefa_embedding is not None:
+            vetor_query = await tarefa_embedding
+        else:
+            vetor_query = await embedding_consulta(relato)
+
+        if categoria in preconsultas:
+            logger.info(f"⚡ Busca especulativa aproveitada para {categoria}.")
+            results = await preconsultas[categoria]
+        else:
+            results = await executar_em(EXECUTOR_EMBEDDING, consultar_colecao, categoria, vetor_query)
+    finally:
+        # Descarta pré-consultas de categorias que não foram escolhidas
+        for tarefa in [tarefa_embedding, *preconsultas.values()]:
+            if tarefa is not None and not tarefa.done():
+                tarefa.cancel()
+
+    if results is None:
+        return {"erro": "Base de dados temporariamente indisponível."}
+
+    # Candidatos (pares relato x decisão para o CrossEncoder)
+    colecao = results.get('colecao')
+    textos = obter_textos_decisoes(colecao) if colecao else None
+    documentos = (results.get('documents') or [None])[0]
     candidatos = []
-    for i in range(len(results['ids'][0])):
-        doc_text = results['documents'][0][i]
+    for i, doc_id in enumerate(results['ids'][0]):
+        if documentos is not None and documentos[i] is not None:
+            doc_text = documentos[i]
+        else:
+            doc_text = textos.obter(doc_id, "documento") if textos is not None else ""
         meta = results['metadatas'][0][i]
         candidatos.append({
+            "id": doc_id,
+            "colecao": colecao,
             "texto": doc_text,
             "meta": meta,
-            "par": [request.relato, doc_text.replace("passage:", "").strip()]
+            "par": [relato, texto_passagem(doc_text)]
         })
 
-    scores = model_cross.predict([c['par'] for c in candidatos])
-    
-    # Ordena e Classifica
-    finais = []
-    vitorias = 0
-    soma_valor = 0
+    await notificar(progresso, "casos_similares", {"n_casos": len(candidatos)})
 
-    for idx, score in sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:20]:
-        item = candidatos[idx]
-        meta = item['meta']
-        
-        # Lógica de Classificação
-        res_txt = str(meta.get("resultado", "")).lower()
-        val = float(meta.get("valor_total", 0))
-        
-        tipo = "DERROTA"
-        if "parcial" in res_txt or "procedente" in res_txt or val > 0:
-            if not ("improcedente" in res_txt and val == 0):
-                tipo = "VITORIA"
-        
-        if tipo == "VITORIA":
-            vitorias += 1
-            soma_valor += val
-            
-        finais.append({
-            "resumo": meta.get("resumo", ""),
-            "valor": val,
-            "data": meta.get("data_julgamento", ""),
-            "link": meta.get("link", "#"),
-            "tipo_resultado": tipo
-        })
+    # Probabilidade e valor usam os 20 candidatos, independente da ordem
+    prob, val_medio = calcular_estatisticas([c['meta'] for c in candidatos], (results.get('numericos') or [None])[0])
+    await notificar(progresso, "probabilidade", {"probabilidade": prob, "valor_estimado": val_medio})
+
+    if RERANK_TOKENS:
+        pares = await executar_em(EXECUTOR_RERANK, tokenizar_pares, relato, [c['texto'] for c in candidatos], results['ids'][0], results.get('colecao'))
+    else:
+        pares = [c['par'] for c in candidatos]
+    distancias = (results.get('distances') or [None])[0]
+
+    if RERANK_ADIADO:
+        # Casos provisórios na ordem densa; a ordem do CrossEncoder chega depois
+        chave = chave_relato(relato)
+        tarefa = asyncio.ensure_future(ordenar_em_segundo_plano(chave, candidatos, pares, distancias))
+        tarefa.add_done_callback(_descartar_resultado)
+        ORDENACOES_CASOS[chave] = tarefa
+        return {
+            "probabilidade": prob,
+            "valor_estimado": val_medio,
+            "categoria": categoria,
+            "n_casos": 20,
+            "casos": ordenar_casos(candidatos, -np.arange(len(candidatos), dtype=np.float32)),
+            "casos_provisorios": True
+        }
 
-    prob = min((vitorias / 20) * 100, 95.0)
-    val_medio = soma_valor / vitorias if vitorias > 0 else 0
+    scores = await reranquear(pares, distancias)
+    
+    # Ordena pelo CrossEncoder
+    finais = ordenar_casos(candidatos, scores)
+
+    return {
+        "probabilidade": prob,
+        "valor_estimado": val_medio,
+        "categoria": categoria,
+        "n_casos": 20,
+        "casos": finais
+    }
+
+# Reordenações adiadas (chave do relato -> tarefa com os 3 casos finais). Ficam aqui
+# depois de concluídas para quem pegou o resultado provisório do cache.
+ORDENACOES_CASOS = TTLCache(maxsize=RESULTADOS_CACHE.maxsize, ttl=600)
+
+async def ordenar_em_segundo_plano(chave, candidatos, pares, distancias):
+    """Reranking adiado: ordena os candidatos e atualiza o resultado memorizado."""
+    scores = await reranquear(pares, distancias)
+    casos = ordenar_casos(candidatos, scores)
+    memorizado = RESULTADOS_CACHE.get(chave)
+    if memorizado is not None and memorizado.get("casos_provisorios"):
+        memorizado["casos"] = copy.deepcopy(casos)
+        memorizado.pop("casos_provisorios", None)
+    return casos
+
+def chave_relato(relato):
+    """Hash do relato normalizado (unicode, caixa e espaços) para o RESULTADOS_CACHE."""
+    texto = unicodedata.normalize("NFKC", relato).lower()
+    texto = " ".join(texto.split())
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+# Análises idênticas em andamento (chave do relato -> tarefa compartilhada)
+ANALISES_EM_ANDAMENTO = {}
+
+async def _processar_e_memorizar(chave, relato, progresso):
+    resultado = await processar_analise(relato, progresso)
+    # Erros ("OUTROS", base indisponível) não são memorizados
+    if "erro" not in resultado:
+        RESULTADOS_CACHE[chave] = resultado
+    return resultado
+
+async def obter_resultado_analise(relato, progresso=None):
+    """
+    Resultado da pipeline para o relato, reaproveitando o cache quando possível.
+    Requisições simultâneas do mesmo relato (duplo clique, retry) aguardam uma
+    única execução compartilhada em vez de rodar a pipeline de novo.
+    """
+    chave = chave_relato(relato)
+    resultado = RESULTADOS_CACHE.get(chave)
+    if resultado is not None:
+        logger.info(f"♻️ Análise reaproveitada do cache ({resultado['categoria']}).")
+    else:
+        tarefa = ANALISES_EM_ANDAMENTO.get(chave)
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(_processar_e_memorizar(chave, relato, progresso))
+            tarefa.add_done_callback(_descartar_resultado)
+            tarefa.add_done_callback(lambda _: ANALISES_EM_ANDAMENTO.pop(chave, None))
+            ANALISES_EM_ANDAMENTO[chave] = tarefa
+        else:
+            logger.info("🔗 Análise idêntica já em andamento: aguardando o mesmo resultado.")
+        # shield: se um cliente desconectar, a execução continua para os demais
+        resultado = await asyncio.shield(tarefa)
+    # Cópia: cada id_analise recebe seus próprios dicts
+    return copy.deepcopy(resultado)
+
+def salvar_analise_db(relato, dados, id_analise):
+    """Insere o lead da análise. Retorna False se não houver conexão com o banco."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO leads (resumo_caso, categoria, probabilidade, valor_estimado, id_analise, json_analise) 
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (relato, dados["categoria"], dados["probabilidade"], dados["valor_estimado"], id_analise, json.dumps(dados, ensure_ascii=False)))
+        conn.commit()
+    except Exception as e:
+        if conn: conn.rollback()
+        logger.error(f"Erro Insert Lead: {e}")
+    finally:
+        release_db_connection(conn)
+    return True
+
+async def registrar_analise(relato, resultado):
+    """Gera o id_analise, salva cache + lead e monta a resposta pública (casos censurados)."""
+    ordenacao = None
+    if resultado.pop("casos_provisorios", False):
+        ordenacao = ORDENACOES_CASOS.get(chave_relato(relato))
+        if ordenacao is not None and ordenacao.done() and not ordenacao.cancelled() and ordenacao.exception() is None:
+            resultado["casos"] = copy.deepcopy(ordenacao.result())
+            ordenacao = None
+    casos_reais = resultado["casos"]
 
     # Prepara Resposta
     casos_censurados = []
-    casos_reais = finais[:3]
-    
     for caso in casos_reais:
         casos_censurados.append({
             "resumo": "🔒 Conteúdo bloqueado...", 
@@ -669,34 +2083,132 @@ def analisar_caso(request: AnaliseRequest):
     
     # Salva Cache
     ANALISES_CACHE[id_analise] = {
-        "probabilidade": prob, 
-        "valor_estimado": val_medio, 
-        "categoria": categoria, 
-        "n_casos": 20, 
+        "probabilidade": resultado["probabilidade"], 
+        "valor_estimado": resultado["valor_estimado"], 
+        "categoria": resultado["categoria"], 
+        "n_casos": resultado["n_casos"], 
         "casos": casos_reais, 
         "pago": False,
-        "relato": request.relato
+        "relato": relato
     }
+    if ordenacao is not None:
+        ANALISES_CACHE[id_analise]["casos_provisorios"] = True
+        ANALISES_PENDENTES[id_analise] = threading.Event()
+
+    # Salva Lead (no executor do banco, sem bloquear o event loop)
+    if not await executar_em(EXECUTOR_DB, salvar_analise_db, relato, ANALISES_CACHE[id_analise], id_analise):
+        ANALISES_PENDENTES.pop(id_analise, None)
+        raise HTTPException(status_code=500, detail="Erro de conexão com banco de dados")
+
+    if ordenacao is not None:
+        tarefa = asyncio.ensure_future(concluir_ordenacao(id_analise, ordenacao))
+        tarefa.add_done_callback(_descartar_resultado)
+
+    return {"id_analise": id_analise, "probabilidade": resultado["probabilidade"], "valor_estimado": resultado["valor_estimado"], "categoria": resultado["categoria"], "n_casos": resultado["n_casos"], "casos": casos_censurados}
 
-    # Salva Lead
+def atualizar_analise_db(id_analise, dados):
+    """Regrava o json_analise do lead (casos finais após o reranking adiado)."""
     conn = get_db_connection()
     if not conn:
-        raise HTTPException(status_code=500, detail="Erro de conexão com banco de dados")
-    
+        return False
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO leads (resumo_caso, categoria, probabilidade, valor_estimado, id_analise, json_analise) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (request.relato, categoria, prob, val_medio, id_analise, json.dumps(ANALISES_CACHE[id_analise], ensure_ascii=False)))
+            cur.execute("UPDATE leads SET json_analise = %s WHERE id_analise = %s", (json.dumps(dados, ensure_ascii=False), id_analise))
         conn.commit()
     except Exception as e:
         if conn: conn.rollback()
-        logger.error(f"Erro Insert Lead: {e}")
+        logger.error(f"Erro Update Lead: {e}")
     finally:
         release_db_connection(conn)
+    return True
+
+async def concluir_ordenacao(id_analise, ordenacao):
+    """Aguarda o reranking adiado e grava os casos finais no cache e no lead."""
+    dados = ANALISES_CACHE.get(id_analise)
+    try:
+        casos = await ordenacao
+        if dados is not None:
+            dados["casos"] = copy.deepcopy(casos)
+    except Exception as e:
+        # Mantém a ordem densa como definitiva
+        logger.error(f"❌ Erro no reranking adiado de {id_analise}: {e}")
+    finally:
+        if dados is not None:
+            dados.pop("casos_provisorios", None)
+            await executar_em(EXECUTOR_DB, atualizar_analise_db, id_analise, dados)
+        evento = ANALISES_PENDENTES.pop(id_analise, None)
+        if evento is not None:
+            evento.set()
+
+@app.post("/api/analisar")
+async def analisar_caso(request: AnaliseRequest):
+    GOOGLE_KEY = os.getenv("GOOGLE_API_KEY")
+    if not GOOGLE_KEY:
+        raise HTTPException(status_code=500, detail="Chave da IA não configurada.")
+
+    resultado = await obter_resultado_analise(request.relato)
+    if "erro" in resultado:
+        return resultado
+
+    return await registrar_analise(request.relato, resultado)
 
-    return {"id_analise": id_analise, "probabilidade": prob, "valor_estimado": val_medio, "categoria": categoria, "n_casos": 20, "casos": casos_censurados}
+@app.post("/api/analisar/stream")
+async def analisar_caso_stream(request: AnaliseRequest):
+    """
+    Variante em Server-Sent Events do /api/analisar. Emite um evento por etapa:
+    categoria -> casos_similares -> probabilidade -> resultado (casos censurados + id_analise).
+    Falhas chegam como evento "erro" com o mesmo detail do endpoint síncrono.
+    """
+    GOOGLE_KEY = os.getenv("GOOGLE_API_KEY")
+    if not GOOGLE_KEY:
+        raise HTTPException(status_code=500, detail="Chave da IA não configurada.")
+
+    fila = asyncio.Queue()
+
+    async def progresso(evento, dados):
+        await fila.put((evento, dados))
+
+    async def executar():
+        try:
+            resultado = await obter_resultado_analise(request.relato, progresso)
+            if "erro" in resultado:
+                await fila.put(("erro", {"detail": resultado["erro"]}))
+                return
+            # Cache/coalescência não emitem etapas: garante todas antes do resultado
+            await fila.put(("categoria", {"categoria": resultado["categoria"]}))
+            await fila.put(("casos_similares", {"n_casos": resultado["n_casos"]}))
+            await fila.put(("probabilidade", {"probabilidade": resultado["probabilidade"], "valor_estimado": resultado["valor_estimado"]}))
+            await fila.put(("resultado", await registrar_analise(request.relato, resultado)))
+        except HTTPException as e:
+            await fila.put(("erro", {"detail": e.detail, "status": e.status_code}))
+        except Exception as e:
+            logger.error(f"❌ Erro na análise (stream): {e}")
+            await fila.put(("erro", {"detail": "Erro interno na análise."}))
+        finally:
+            await fila.put((None, None))
+
+    async def eventos():
+        tarefa = asyncio.ensure_future(executar())
+        enviados = set()
+        try:
+            while True:
+                evento, dados = await fila.get()
+                if evento is None:
+                    break
+                if evento in enviados:
+                    continue
+                enviados.add(evento)
+                yield f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+        finally:
+            # Cliente desconectou: a pipeline compartilhada segue (shield), só o registro é cancelado
+            if not tarefa.done():
+                tarefa.cancel()
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/api/salvar_lead")
 def salvar_lead(lead: LeadData):
@@ -961,7 +2473,7 @@ async def transcrever_audio(file: UploadFile = File(...)):
         with open(temp_filename, "wb") as f:
             f.write(content)
 
-        client = genai.Client(api_key=GOOGLE_KEY)
+        client = PROVEDORES_LLM["gemini"].cliente
         
         # Upload para o Google AI File API
         logger.info("⬆️ Enviando áudio para Google AI...")
@@ -1352,6 +2864,12 @@ def admin_reenviar_email(req: AdminActionRequest, background_tasks: BackgroundTa
 
     return {"status": "ok", "mensagem": "E-mail será reenviado em instantes."}
 
+@app.post("/api/admin/colecoes/recarregar")
+async def admin_recarregar_colecoes(auth: AdminAuth):
+    if auth.senha != SENHA_ADMIN: raise HTTPException(status_code=401)
+    trocadas = await aplicar_novas_versoes()
+    return {"trocadas": trocadas, "versoes": dict(GERENCIADOR_COLECOES.aliases)}
+
 @app.get("/api/admin/logs")
 def get_activity_logs(limit: int = 50):
     conn = get_db_connection()
@@ -1492,7 +3010,19 @@ def get_system_metrics():
             "application": {
                 "cache_items": cache_size,
                 "cache_max": cache_max,
-                "db_pool": db_pool_status
+                "resultados_cache": len(RESULTADOS_CACHE),
+                "analises_em_andamento": len(ANALISES_EM_ANDAMENTO),
+                "ordenacoes_pendentes": len(ANALISES_PENDENTES),
+                "db_pool": db_pool_status,
+                "colecoes": GERENCIADOR_COLECOES.estatisticas(),
+                "chroma": chroma_client.estatisticas() if isinstance(chroma_client, PoolChroma) else {"modo": CHROMA_MODO},
+                "llm": {nome: p.estatisticas() for nome, p in PROVEDORES_LLM.items()},
+                "batching": {
+                    "embedding": BATCHER_EMBEDDING.estatisticas(),
+                    "rerank": BATCHER_RERANK.estatisticas(),
+                    "classificacao": BATCHER_CLASSIFICACAO.estatisticas()
+                },
+                "rerank_adaptativo": dict(RERANK_ESTATISTICAS, ativo=RERANK_ADAPTATIVO)
             },
             "history": history
         }
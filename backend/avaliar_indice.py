@@ -0,0 +1,95 @@
+import sys
+import json
+import time
+import numpy as np
+from pathlib import Path
+from indice_vetorial import IndiceVetorial, INDICE_NUMPY_DIR
+
+# Compara a busca aproximada (quantizada ou reduzida por PCA) com a busca exata em float
+# no índice NumPy: recall@20, latência por consulta e memória varrida, para escolher
+# BUSCA_QUANTIZACAO e BUSCA_CANDIDATOS. Com "pca" e 20 candidatos, a busca usa só os
+# vetores reduzidos (sem reordenação). As consultas são decisões da própria coleção
+# (excluída a si mesma).
+# Uso: ../venv/bin/python avaliar_indice.py [COLECAO ...]  (padrão: todas as coleções)
+
+CURRENT_DIR = Path(__file__).resolve().parent
+ALIAS_COLECOES_PATH = CURRENT_DIR / "colecoes_alias.json"
+
+K = 20
+N_CONSULTAS = 200
+MODOS = [
+    ("float", None, None),
+    ("int8", "int8", 100),
+    ("int8", "int8", 200),
+    ("binario", "binario", 200),
+    ("binario", "binario", 400),
+    ("binario", "binario", 800),
+    ("pca", "pca", K),
+    ("pca", "pca", 100),
+]
+
+def resolver_colecoes(nomes):
+    aliases = json.loads(ALIAS_COLECOES_PATH.read_text(encoding="utf-8")) if ALIAS_COLECOES_PATH.exists() else {}
+    if not nomes:
+        return sorted(aliases.values()) or sorted(p.name for p in INDICE_NUMPY_DIR.iterdir() if p.is_dir())
+    return [aliases.get(n, n) for n in nomes]
+
+def vizinhos(indice, consultas, linhas, k):
+    """Top-k de cada consulta sem a própria decisão, e a latência de cada busca (ms)."""
+    resultados, latencias = [], []
+    for q, propria in zip(consultas, linhas):
+        inicio = time.perf_counter()
+        top, _ = indice.buscar(q[None, :], k + 1)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        resultados.append([i for i in top[0] if i != propria][:k])
+    return resultados, np.asarray(latencias)
+
+def recall(exatos, aproximados):
+    return float(np.mean([len(set(e) & set(a)) / len(e) for e, a in zip(exatos, aproximados) if e]))
+
+def avaliar_modos(diretorio, modos):
+    """Recall@20, latência e memória de cada (rótulo, quantização, candidatos) contra a busca exata."""
+    exato = IndiceVetorial(diretorio)
+    rng = np.random.default_rng(42)
+    linhas = rng.choice(exato.count(), size=min(N_CONSULTAS, exato.count()), replace=False)
+    consultas = np.asarray(exato.vetores[linhas], dtype=np.float32)
+    referencia, _ = vizinhos(exato, consultas, linhas, K)
+
+    linhas_relatorio = []
+    for rotulo, quantizacao, candidatos in modos:
+        if quantizacao == "pca" and not (Path(diretorio) / "vetores_pca.npy").exists():
+            continue
+        indice = exato if quantizacao is None else IndiceVetorial(diretorio, quantizacao, candidatos)
+        encontrados, latencias = vizinhos(indice, consultas, linhas, K)
+        linha = {
+            "modo": rotulo,
+            "candidatos": candidatos,
+            "recall": recall(referencia, encontrados),
+            "p50_ms": float(np.percentile(latencias, 50)),
+            "p95_ms": float(np.percentile(latencias, 95)),
+            "memoria_mb": indice.memoria() / 1024**2,
+        }
+        linhas_relatorio.append(linha)
+    return linhas_relatorio
+
+def recall_pca(diretorio):
+    """Recall@20 da busca só com os vetores reduzidos (usado no fim da migração)."""
+    return avaliar_modos(diretorio, [("pca", "pca", K)])[0]["recall"]
+
+def avaliar_colecao(nome):
+    diretorio = INDICE_NUMPY_DIR / nome
+    linhas_relatorio = avaliar_modos(diretorio, MODOS)
+    print(f"\n📊 {nome} ({N_CONSULTAS} consultas)")
+    if (diretorio / "pca.json").exists():
+        pca = json.loads((diretorio / "pca.json").read_text(encoding="utf-8"))
+        print(f"   PCA: {pca['dimensao']} dimensões, {pca['variancia_explicada']:.1%} da variância")
+    print(f"   {'modo':<8} {'candidatos':>10} {'recall@20':>10} {'p50 ms':>8} {'p95 ms':>8} {'memória MB':>11}")
+    for linha in linhas_relatorio:
+        print(f"   {linha['modo']:<8} {linha['candidatos'] or '-':>10} {linha['recall']:>10.4f} {linha['p50_ms']:>8.3f} {linha['p95_ms']:>8.3f} {linha['memoria_mb']:>11.2f}")
+    return linhas_relatorio
+
+if __name__ == "__main__":
+    relatorio = {nome: avaliar_colecao(nome) for nome in resolver_colecoes(sys.argv[1:])}
+    with open(INDICE_NUMPY_DIR / "avaliacao.json", "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=2)
+    print(f"\n✅ Relatório salvo em {INDICE_NUMPY_DIR / 'avaliacao.json'}")
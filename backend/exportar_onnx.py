@@ -0,0 +1,109 @@
+import os
+import json
+import numpy as np
+from pathlib import Path
+from dotenv import load_dotenv
+from sentence_transformers import SentenceTransformer, CrossEncoder, export_dynamic_quantized_onnx_model
+
+# Exporta o bi-encoder (e5) e o cross-encoder (mmarco) para ONNX com quantização
+# dinâmica int8 e compara os resultados com os modelos fp32 originais.
+# Uso: ../venv/bin/python exportar_onnx.py  (depois INFERENCIA_BACKEND=onnx no .env)
+
+load_dotenv()
+
+# Configurações
+CURRENT_DIR = Path(__file__).resolve().parent
+ONNX_DIR = CURRENT_DIR / "modelos_onnx"
+MODELO_BI = "intfloat/multilingual-e5-large"
+MODELO_CROSS = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+# arm64 | avx2 | avx512 | avx512_vnni (deve bater com a CPU do servidor)
+ONNX_QUANTIZACAO = os.getenv("ONNX_QUANTIZACAO", "avx2")
+ARQUIVO_QUANTIZADO = f"onnx/model_qint8_{ONNX_QUANTIZACAO}.onnx"
+
+# Limites de paridade int8 x fp32
+PARIDADE_COS_MIN = float(os.getenv("ONNX_PARIDADE_COS_MIN", "0.98"))
+PARIDADE_RANK_MIN = float(os.getenv("ONNX_PARIDADE_RANK_MIN", "0.95"))
+
+RELATOS_TESTE = [
+    "Meu voo para Curitiba foi cancelado sem aviso e a companhia não ofereceu hotel nem alimentação.",
+    "Fiz um Pix para um golpista que clonou o WhatsApp da minha mãe e o banco se recusou a devolver.",
+    "Meu nome foi negativado no Serasa por uma dívida que já estava paga há mais de um ano.",
+    "O plano de saúde negou a cobertura da cirurgia que o médico indicou como urgente.",
+    "Comprei uma geladeira pela internet, paguei à vista e o produto nunca foi entregue.",
+    "A concessionária cortou a luz da minha casa mesmo com todas as contas em dia.",
+]
+
+DECISOES_TESTE = [
+    "passage: Cancelamento de voo sem assistência material. Dano moral configurado. Indenização fixada em R$ 8.000,00.",
+    "passage: Fraude via Pix. Falha na prestação do serviço bancário não demonstrada. Culpa exclusiva da vítima. Pedido improcedente.",
+    "passage: Inscrição indevida em cadastro de inadimplentes após quitação do débito. Dano moral in re ipsa. Recurso provido.",
+    "passage: Negativa de cobertura de procedimento cirúrgico de urgência. Abusividade. Danos morais arbitrados em R$ 10.000,00.",
+    "passage: Compra online não entregue. Responsabilidade solidária da plataforma. Restituição do valor pago.",
+    "passage: Suspensão do fornecimento de energia elétrica sem débito pendente. Ilegalidade. Dano moral reconhecido.",
+]
+
+def exportar_bi_encoder():
+    destino = ONNX_DIR / "bi_encoder"
+    print(f"🚀 Exportando {MODELO_BI} para ONNX em {destino}...")
+    modelo = SentenceTransformer(MODELO_BI, backend="onnx")
+    modelo.save_pretrained(str(destino))
+    export_dynamic_quantized_onnx_model(modelo, ONNX_QUANTIZACAO, str(destino))
+    print(f"✅ Bi-encoder quantizado: {destino / ARQUIVO_QUANTIZADO}")
+
+def exportar_cross_encoder():
+    destino = ONNX_DIR / "cross_encoder"
+    print(f"🚀 Exportando {MODELO_CROSS} para ONNX em {destino}...")
+    modelo = CrossEncoder(MODELO_CROSS, backend="onnx")
+    modelo.save_pretrained(str(destino))
+    export_dynamic_quantized_onnx_model(modelo, ONNX_QUANTIZACAO, str(destino))
+    print(f"✅ Cross-encoder quantizado: {destino / ARQUIVO_QUANTIZADO}")
+
+def correlacao_ranks(a, b):
+    """Correlação de Spearman (sem scipy): Pearson entre as posições."""
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+def verificar_paridade():
+    print("🔎 Verificando paridade int8 x fp32...")
+    consultas = [f"query: {r}" for r in RELATOS_TESTE]
+
+    bi_fp32 = SentenceTransformer(MODELO_BI)
+    bi_int8 = SentenceTransformer(str(ONNX_DIR / "bi_encoder"), backend="onnx", model_kwargs={"file_name": ARQUIVO_QUANTIZADO})
+    textos = consultas + DECISOES_TESTE
+    emb_fp32 = bi_fp32.encode(textos, normalize_embeddings=True)
+    emb_int8 = bi_int8.encode(textos, normalize_embeddings=True)
+    cos = (emb_fp32 * emb_int8).sum(axis=1)
+
+    cross_fp32 = CrossEncoder(MODELO_CROSS)
+    cross_int8 = CrossEncoder(str(ONNX_DIR / "cross_encoder"), backend="onnx", model_kwargs={"file_name": ARQUIVO_QUANTIZADO})
+    pares = [[r, d.replace("passage:", "").strip()] for r in RELATOS_TESTE for d in DECISOES_TESTE]
+    scores_fp32 = np.asarray(cross_fp32.predict(pares))
+    scores_int8 = np.asarray(cross_int8.predict(pares))
+    rank = correlacao_ranks(scores_fp32, scores_int8)
+
+    resultado = {
+        "quantizacao": ONNX_QUANTIZACAO,
+        "bi_cos_min": float(cos.min()),
+        "bi_cos_medio": float(cos.mean()),
+        "cross_diff_max": float(np.abs(scores_fp32 - scores_int8).max()),
+        "cross_spearman": rank,
+    }
+    resultado["aprovado"] = resultado["bi_cos_min"] >= PARIDADE_COS_MIN and rank >= PARIDADE_RANK_MIN
+
+    with open(ONNX_DIR / "paridade.json", "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2)
+
+    print(f"   ↳ Bi-encoder: cosseno mínimo {resultado['bi_cos_min']:.4f} (médio {resultado['bi_cos_medio']:.4f})")
+    print(f"   ↳ Cross-encoder: Spearman {rank:.4f}, diferença máx. {resultado['cross_diff_max']:.4f}")
+    if resultado["aprovado"]:
+        print("✅ Paridade aprovada. Defina INFERENCIA_BACKEND=onnx no .env e reinicie a API.")
+    else:
+        print("❌ Paridade reprovada! Mantenha INFERENCIA_BACKEND=torch.")
+    return resultado
+
+if __name__ == "__main__":
+    ONNX_DIR.mkdir(parents=True, exist_ok=True)
+    exportar_bi_encoder()
+    exportar_cross_encoder()
+    verificar_paridade()
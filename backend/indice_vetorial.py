@@ -0,0 +1,283 @@
+import os
+import json
+import logging
+import numpy as np
+from pathlib import Path
+
+# Índice vetorial em NumPy: alternativa ao ChromaDB para as coleções de jurisprudência.
+# Cada coleção vira um diretório com a matriz de vetores (memory-mapped) e os metadados
+# em arrays paralelos; a busca é um único produto matricial com ranking exato.
+# Opcionalmente (quantizacao="int8", "binario" ou "pca") a primeira passada varre só os
+# códigos quantizados (ou os vetores reduzidos por PCA) e apenas os melhores candidatos
+# são reordenados com os vetores float.
+# Uso (exporta as coleções já existentes no ChromaDB): ../venv/bin/python indice_vetorial.py
+
+logger = logging.getLogger(__name__)
+
+CURRENT_DIR = Path(__file__).resolve().parent
+CHROMA_DB_DIR = CURRENT_DIR / "chroma_db"
+INDICE_NUMPY_DIR = CURRENT_DIR / "indice_numpy"
+
+# Campos de metadados guardados como listas paralelas (texto) ou arrays numéricos
+CAMPOS_TEXTO = ["resumo", "data_julgamento", "resultado", "link"]
+CAMPOS_NUMERICOS = ["valor_total", "valor"]
+CAMPOS_BOOLEANOS = ["vitoria"]
+
+# Varredura int8 em blocos: limita a conversão temporária para float32
+BLOCO_INT8 = 4096
+MODOS_QUANTIZACAO = ("int8", "binario", "pca")
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def quantizar_int8(matriz):
+    """Quantização simétrica por dimensão: x ≈ codigos * escala."""
+    escala = np.abs(matriz).max(axis=0) / 127.0
+    escala[escala == 0] = 1.0
+    codigos = np.clip(np.rint(matriz / escala), -127, 127).astype(np.int8)
+    return codigos, escala.astype(np.float32)
+
+def quantizar_binario(matriz):
+    """Um bit por dimensão (sinal), empacotado: 1024 dims viram 128 bytes."""
+    return np.packbits(matriz > 0, axis=1)
+
+def ajustar_pca(matriz, dimensao):
+    """PCA do corpus: (componentes [dimensao x d], média [d], variância explicada acumulada)."""
+    from sklearn.decomposition import PCA
+
+    pca = PCA(n_components=min(dimensao, *matriz.shape), svd_solver="randomized", random_state=42)
+    pca.fit(matriz)
+    return pca.components_.astype(np.float32), pca.mean_.astype(np.float32), float(pca.explained_variance_ratio_.sum())
+
+def projetar_pca(matriz, componentes, media):
+    return ((np.asarray(matriz, dtype=np.float32) - media) @ componentes.T).astype(np.float32)
+
+def salvar_indice(diretorio, ids, vetores, documentos, metadados, dtype="float32", dimensao_pca=256):
+    """Grava a coleção no formato do índice NumPy (sobrescreve o diretório)."""
+    diretorio = Path(diretorio)
+    diretorio.mkdir(parents=True, exist_ok=True)
+
+    matriz = np.ascontiguousarray(np.asarray(vetores, dtype=np.float32).astype(dtype))
+    np.save(diretorio / "vetores.npy", matriz)
+    # Normas calculadas sobre os vetores já convertidos: a distância bate com o que é buscado
+    np.save(diretorio / "normas2.npy", (matriz.astype(np.float32) ** 2).sum(axis=1))
+
+    codigos, escala = quantizar_int8(matriz.astype(np.float32))
+    np.save(diretorio / "int8.npy", codigos)
+    np.save(diretorio / "int8_escala.npy", escala)
+    np.save(diretorio / "binario.npy", quantizar_binario(matriz))
+
+    if dimensao_pca:
+        componentes, media, variancia = ajustar_pca(matriz.astype(np.float32), dimensao_pca)
+        np.save(diretorio / "pca_componentes.npy", componentes)
+        np.save(diretorio / "pca_media.npy", media)
+        np.save(diretorio / "vetores_pca.npy", projetar_pca(matriz, componentes, media))
+        with open(diretorio / "pca.json", "w", encoding="utf-8") as f:
+            json.dump({"dimensao": int(componentes.shape[0]), "variancia_explicada": variancia}, f)
+
+    # Campos tipados só são gravados se a migração os gerou (coleções antigas não têm)
+    # Valores em R$ em float64: float32 perde centavos a partir de ~R$ 100 mil
+    for campo in CAMPOS_NUMERICOS:
+        if metadados and campo in metadados[0]:
+            valores = [float(m.get(campo, 0) or 0) for m in metadados]
+            np.save(diretorio / f"{campo}.npy", np.asarray(valores, dtype=np.float64))
+    for campo in CAMPOS_BOOLEANOS:
+        if metadados and campo in metadados[0]:
+            np.save(diretorio / f"{campo}.npy", np.asarray([bool(m.get(campo)) for m in metadados]))
+
+    # Sem documentos/resumo/link quando eles ficam em textos_decisoes/ (migração atual)
+    textos = {"ids": list(ids), "documentos": list(documentos or [])}
+    for campo in CAMPOS_TEXTO:
+        if metadados and campo in metadados[0]:
+            textos[campo] = [str(m.get(campo, "")) for m in metadados]
+    with open(diretorio / "metadados.json", "w", encoding="utf-8") as f:
+        json.dump(textos, f, ensure_ascii=False)
+
+class IndiceVetorial:
+    """
+    Coleção carregada em memória. Expõe o mesmo subconjunto da API de Collection do
+    ChromaDB usado pela API (query, get, count), então pode substituí-la diretamente.
+    A distância é L2 ao quadrado (padrão do Chroma), calculada de forma exata:
+    |q - x|² = |x|² - 2 q·x + |q|².
+
+    Com `quantizacao`, a primeira passada usa os códigos int8 (produto aproximado) ou
+    binários (distância de Hamming) e só `candidatos` linhas por consulta são lidas dos
+    vetores float para a distância exata. Os vetores float ficam só no memory-map.
+    """
+
+    def __init__(self, diretorio, quantizacao=None, candidatos=200):
+        self.diretorio = Path(diretorio)
+        self.nome = self.diretorio.name
+        self.name = self.nome  # mesmo atributo da Collection do Chroma
+        self.quantizacao = quantizacao or None
+        self.candidatos = candidatos
+        # Modo inválido ou índice sem PCA: busca exata em float em vez de derrubar a coleção
+        if self.quantizacao and self.quantizacao not in MODOS_QUANTIZACAO:
+            logger.warning(f"⚠️ Quantização desconhecida '{self.quantizacao}' em {self.nome}. Usando busca exata.")
+            self.quantizacao = None
+        elif self.quantizacao == "pca" and not (self.diretorio / "vetores_pca.npy").exists():
+            logger.warning(f"⚠️ Índice {self.nome} exportado sem PCA (refaça com INDICE_PCA_DIM > 0). Usando busca exata.")
+            self.quantizacao = None
+
+        vetores = np.load(self.diretorio / "vetores.npy", mmap_mode="r")
+        if self.quantizacao or vetores.dtype == np.float32:
+            self.vetores = vetores
+        else:
+            # float16 em disco é expandido uma vez: matmul em float16 não usa BLAS
+            self.vetores = np.ascontiguousarray(vetores, dtype=np.float32)
+        self.normas2 = np.load(self.diretorio / "normas2.npy", mmap_mode="r")
+        if self.quantizacao:
+            self._carregar_codigos()
+        self.numericos = {c: np.load(self.diretorio / f"{c}.npy", mmap_mode="r") for c in CAMPOS_NUMERICOS + CAMPOS_BOOLEANOS if (self.diretorio / f"{c}.npy").exists()}
+
+        with open(self.diretorio / "metadados.json", "r", encoding="utf-8") as f:
+            textos = json.load(f)
+        self.ids = textos.pop("ids")
+        self.documentos = textos.pop("documentos")
+        self.textos = textos
+
+    def _carregar_codigos(self):
+        """Códigos quantizados em RAM (gerados aqui se o índice foi exportado sem eles)."""
+        if self.quantizacao == "int8":
+            if (self.diretorio / "int8.npy").exists():
+                self.codigos = np.load(self.diretorio / "int8.npy")
+                self.escala = np.load(self.diretorio / "int8_escala.npy")
+            else:
+                self.codigos, self.escala = quantizar_int8(np.asarray(self.vetores, dtype=np.float32))
+        elif self.quantizacao == "binario":
+            if (self.diretorio / "binario.npy").exists():
+                self.codigos = np.load(self.diretorio / "binario.npy")
+            else:
+                self.codigos = quantizar_binario(np.asarray(self.vetores, dtype=np.float32))
+            self.codigos = np.ascontiguousarray(self.codigos)
+        elif self.quantizacao == "pca":
+            self.componentes = np.load(self.diretorio / "pca_componentes.npy")
+            self.media = np.load(self.diretorio / "pca_media.npy")
+            self.codigos = np.load(self.diretorio / "vetores_pca.npy")
+            self.normas2_pca = (self.codigos ** 2).sum(axis=1)
+
+    def count(self):
+        return len(self.ids)
+
+    def memoria(self):
+        """Bytes que a varredura mantém em memória (vetores float ou códigos quantizados)."""
+        if self.quantizacao == "pca":
+            return self.codigos.nbytes + self.componentes.nbytes + self.normas2.nbytes
+        if self.quantizacao:
+            return self.codigos.nbytes + self.normas2.nbytes
+        return self.vetores.shape[0] * self.vetores.shape[1] * 4 + self.normas2.nbytes
+
+    def metadados(self, i):
+        meta = {c: self.textos[c][i] for c in CAMPOS_TEXTO if c in self.textos}
+        for c, valores in self.numericos.items():
+            meta[c] = bool(valores[i]) if c in CAMPOS_BOOLEANOS else float(valores[i])
+        return meta
+
+    def distancias(self, q):
+        """Distâncias L2² de cada consulta (linhas de q) para todos os vetores."""
+        return self.normas2[None, :] - 2.0 * (q @ self.vetores.T) + (q * q).sum(axis=1)[:, None]
+
+    def distancias_aproximadas(self, q):
+        """Primeira passada: L2² aproximada (int8), de Hamming (binário) ou no espaço reduzido (PCA)."""
+        if self.quantizacao == "pca":
+            reduzida = projetar_pca(q, self.componentes, self.media)
+            # |q|² é constante por linha e não muda a ordem
+            return self.normas2_pca[None, :] - 2.0 * (reduzida @ self.codigos.T)
+        if self.quantizacao == "binario":
+            bits = quantizar_binario(q)
+            if hasattr(np, "bitwise_count") and self.codigos.shape[1] % 8 == 0:
+                # NumPy >= 2.0: XOR + popcount em palavras de 64 bits
+                codigos, bits = self.codigos.view(np.uint64), bits.view(np.uint64)
+                return np.stack([np.bitwise_count(np.bitwise_xor(codigos, b)).sum(axis=1, dtype=np.int32) for b in bits])
+            return np.stack([POPCOUNT[np.bitwise_xor(self.codigos, b)].sum(axis=1, dtype=np.int32) for b in bits])
+
+        q_escalado = q * self.escala
+        produto = np.empty((q.shape[0], self.codigos.shape[0]), dtype=np.float32)
+        for inicio in range(0, self.codigos.shape[0], BLOCO_INT8):
+            bloco = self.codigos[inicio:inicio + BLOCO_INT8].astype(np.float32)
+            produto[:, inicio:inicio + BLOCO_INT8] = q_escalado @ bloco.T
+        return self.normas2[None, :] - 2.0 * produto
+
+    def buscar(self, q, n_results):
+        """Top-n por consulta: (índices, distâncias), em ordem crescente de distância."""
+        if self.quantizacao:
+            return self.buscar_quantizado(q, n_results)
+        d2 = self.distancias(q)
+        top = menores(d2, n_results)
+        return top, np.take_along_axis(d2, top, axis=1)
+
+    def buscar_quantizado(self, q, n_results):
+        """Candidatos pela passada quantizada, reordenados pela distância exata."""
+        candidatos = menores(self.distancias_aproximadas(q), max(self.candidatos, n_results))
+        indices, distancias = [], []
+        for consulta, linha in zip(q, candidatos):
+            linha = np.sort(linha)  # leitura sequencial do memory-map
+            vetores = np.asarray(self.vetores[linha], dtype=np.float32)
+            d2 = self.normas2[linha] - 2.0 * (vetores @ consulta) + consulta @ consulta
+            top = menores(d2[None, :], n_results)[0]
+            indices.append(linha[top])
+            distancias.append(d2[top])
+        return np.vstack(indices), np.vstack(distancias)
+
+    def query(self, query_embeddings, n_results=10, include=("metadatas", "documents", "distances")):
+        q = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.vetores.shape[1])
+        indices, distancias = self.buscar(q, n_results)
+
+        res = {"ids": [[self.ids[i] for i in linha] for linha in indices]}
+        if "distances" in include:
+            res["distances"] = distancias.tolist()
+        if "documents" in include:
+            res["documents"] = [[self.documentos[i] if self.documentos else None for i in linha] for linha in indices]
+        if "metadatas" in include:
+            res["metadatas"] = [[self.metadados(i) for i in linha] for linha in indices]
+            # Extensão do formato do Chroma: campos tipados já como arrays, sem passar pelos dicts
+            if "vitoria" in self.numericos:
+                res["numericos"] = [{c: np.asarray(v[linha]) for c, v in self.numericos.items()} for linha in indices]
+        if "embeddings" in include:
+            res["embeddings"] = [np.asarray(self.vetores[linha], dtype=np.float32) for linha in indices]
+        return res
+
+    def get(self, include=("metadatas", "documents"), limit=None, offset=0):
+        fim = len(self.ids) if limit is None else min(offset + limit, len(self.ids))
+        res = {"ids": self.ids[offset:fim]}
+        if "embeddings" in include:
+            res["embeddings"] = np.asarray(self.vetores[offset:fim], dtype=np.float32)
+        if "documents" in include:
+            res["documents"] = self.documentos[offset:fim] if self.documentos else [None] * (fim - offset)
+        if "metadatas" in include:
+            res["metadatas"] = [self.metadados(i) for i in range(offset, fim)]
+        return res
+
+def menores(d, k):
+    """Índices dos k menores valores de cada linha, em ordem crescente."""
+    k = min(k, d.shape[1])
+    top = np.argpartition(d, k - 1, axis=1)[:, :k]
+    ordem = np.argsort(np.take_along_axis(d, top, axis=1), axis=1)
+    return np.take_along_axis(top, ordem, axis=1)
+
+def exportar_de_chroma(collection, destino, dtype="float32", dimensao_pca=256, lote=1000):
+    """Copia uma coleção do ChromaDB para o formato do índice NumPy."""
+    ids, vetores, documentos, metadados = [], [], [], []
+    offset = 0
+    while True:
+        dados = collection.get(include=["embeddings", "documents", "metadatas"], limit=lote, offset=offset)
+        if len(dados["ids"]) == 0:
+            break
+        ids.extend(dados["ids"])
+        vetores.extend(np.asarray(dados["embeddings"], dtype=np.float32))
+        documentos.extend(d or "" for d in dados["documents"])
+        metadados.extend(m or {} for m in dados["metadatas"])
+        offset += lote
+    salvar_indice(destino, ids, np.vstack(vetores), documentos, metadados, dtype, dimensao_pca)
+    return len(ids)
+
+if __name__ == "__main__":
+    import chromadb
+
+    dtype = os.getenv("INDICE_NUMPY_DTYPE", "float32")
+    dimensao_pca = int(os.getenv("INDICE_PCA_DIM", "256"))
+    client = chromadb.PersistentClient(path=str(CHROMA_DB_DIR))
+    print(f"📂 Exportando coleções de {CHROMA_DB_DIR} para {INDICE_NUMPY_DIR} ({dtype})...")
+    for col in client.list_collections():
+        nome = col if isinstance(col, str) else col.name
+        total = exportar_de_chroma(client.get_collection(nome), INDICE_NUMPY_DIR / nome, dtype, dimensao_pca)
+        print(f"✅ {nome}: {total} vetores exportados.")
+    print("🎉 Índice NumPy pronto. Defina BUSCA_BACKEND=numpy no .env e reinicie a API.")
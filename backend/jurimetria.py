@@ -0,0 +1,16 @@
+# Regra jurídica de desfecho das decisões, compartilhada pela migração (que grava o
+# resultado como metadado tipado) e pela API (fallback para coleções antigas).
+
+def classificar_resultado(resultado, valor_total):
+    """Retorna (vitoria, valor) a partir do texto do resultado e do valor da condenação."""
+    res_txt = str(resultado or "").lower()
+    try:
+        val = float(valor_total or 0)
+    except (TypeError, ValueError):
+        val = 0.0
+
+    vitoria = False
+    if "parcial" in res_txt or "procedente" in res_txt or val > 0:
+        if not ("improcedente" in res_txt and val == 0):
+            vitoria = True
+    return vitoria, val
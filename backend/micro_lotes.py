@@ -0,0 +1,87 @@
+import asyncio
+import logging
+
+# Micro-batching entre requisições: itens enviados por requisições concorrentes dentro
+# de uma janela curta são processados numa única chamada (embedding, rerank, LLM).
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Junta itens enviados por requisições concorrentes durante até `espera_ms`
+    (ou até `tamanho_max` itens) e processa todos numa única chamada de
+    `processar_lote(itens) -> resultados` (corrotina, um resultado por item).
+    """
+
+    def __init__(self, nome, processar_lote, tamanho_max=16, espera_ms=5.0):
+        self.nome = nome
+        self.processar_lote = processar_lote
+        self.tamanho_max = max(1, tamanho_max)
+        self.espera = espera_ms / 1000.0
+        self._fila = None
+        self._cheio = None
+        self._coletor = None
+        self._em_execucao = set()
+        self.lotes = 0
+        self.itens = 0
+        self.maior_lote = 0
+
+    async def submeter(self, item):
+        if self._coletor is None:
+            self._fila = asyncio.Queue()
+            self._cheio = asyncio.Event()
+            self._coletor = asyncio.create_task(self._coletar())
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._fila.put_nowait((item, futuro))
+        # O coletor já tirou o primeiro item da fila: lote cheio = tamanho_max - 1 na fila
+        if self._fila.qsize() >= self.tamanho_max - 1:
+            self._cheio.set()
+        return await futuro
+
+    async def _coletar(self):
+        while True:
+            lote = [await self._fila.get()]
+
+            # Janela de espera: encerra antes se o lote encher
+            if self.espera > 0 and self._fila.qsize() < self.tamanho_max - 1:
+                self._cheio.clear()
+                try:
+                    await asyncio.wait_for(self._cheio.wait(), self.espera)
+                except asyncio.TimeoutError:
+                    pass
+
+            while len(lote) < self.tamanho_max and not self._fila.empty():
+                lote.append(self._fila.get_nowait())
+
+            # Despacha sem bloquear a coleta do próximo lote
+            tarefa = asyncio.create_task(self._executar(lote))
+            self._em_execucao.add(tarefa)
+            tarefa.add_done_callback(self._em_execucao.discard)
+
+    async def _executar(self, lote):
+        ativos = [(item, futuro) for item, futuro in lote if not futuro.cancelled()]
+        if not ativos:
+            return
+
+        self.lotes += 1
+        self.itens += len(ativos)
+        self.maior_lote = max(self.maior_lote, len(ativos))
+        try:
+            resultados = await self.processar_lote([item for item, _ in ativos])
+            for (_, futuro), resultado in zip(ativos, resultados):
+                if not futuro.done():
+                    futuro.set_result(resultado)
+        except Exception as e:
+            logger.error(f"❌ Erro no lote {self.nome}: {e}")
+            for _, futuro in ativos:
+                if not futuro.done():
+                    futuro.set_exception(e)
+
+    def estatisticas(self):
+        return {
+            "lotes": self.lotes,
+            "itens": self.itens,
+            "media_lote": round(self.itens / self.lotes, 2) if self.lotes else 0,
+            "maior_lote": self.maior_lote
+        }
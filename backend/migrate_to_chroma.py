@@ -1,17 +1,86 @@
 import os
+import re
+import json
+import shutil
 import pickle
 import chromadb
 import pandas as pd
 from pathlib import Path
+from dotenv import load_dotenv
+from transformers import AutoTokenizer
+from indice_vetorial import salvar_indice
+from jurimetria import classificar_resultado
+from tokens_passagens import salvar_tokens, TOKENS_PASSAGENS_DIR
+from textos_decisoes import salvar_textos, TEXTOS_DECISOES_DIR
+from avaliar_indice import recall_pca
+
+load_dotenv()
 
 # Configurações
 CURRENT_DIR = Path(__file__).resolve().parent
 DB_DIR = CURRENT_DIR
 CHROMA_DB_DIR = DB_DIR / "chroma_db"
+INDICE_NUMPY_DIR = DB_DIR / "indice_numpy"
+# Cada migração cria uma versão nova (AEREO__v7) e só no fim aponta o alias AEREO para ela.
+# A API em execução troca de versão sozinha ao ver o arquivo mudar (sem restart).
+ALIAS_COLECOES_PATH = DB_DIR / "colecoes_alias.json"
+VERSOES_MANTIDAS = 2  # atual + anterior (rollback: edite o alias de volta)
+# Tokenizer do CrossEncoder da API: as passagens são gravadas já tokenizadas (RERANK_TOKENS=1)
+MODELO_CROSS = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+tokenizer_cross = AutoTokenizer.from_pretrained(MODELO_CROSS)
+# float32 (padrão) ou float16 (metade do espaço em disco) para o índice NumPy
+INDICE_NUMPY_DTYPE = os.getenv("INDICE_NUMPY_DTYPE", "float32")
+# Dimensão da projeção PCA ajustada por coleção (0 = não gera vetores reduzidos)
+INDICE_PCA_DIM = int(os.getenv("INDICE_PCA_DIM", "256"))
+
+# Com CHROMA_MODO=http a API usa o servidor Chroma compartilhado: a migração
+# escreve por ele (abrir o mesmo diretório em paralelo ao servidor corrompe o índice)
+CHROMA_MODO = os.getenv("CHROMA_MODO", "local").lower()
+CHROMA_HOST = os.getenv("CHROMA_HOST", "127.0.0.1")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
+
+if CHROMA_MODO == "http":
+    print(f"📂 Conectando ao servidor ChromaDB em: {CHROMA_HOST}:{CHROMA_PORT}")
+    client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+else:
+    # Inicializa ChromaDB (Persistente)
+    print(f"📂 Criando/Abrindo banco ChromaDB em: {CHROMA_DB_DIR}")
+    client = chromadb.PersistentClient(path=str(CHROMA_DB_DIR))
+
+def ler_aliases():
+    if not ALIAS_COLECOES_PATH.exists():
+        return {}
+    with open(ALIAS_COLECOES_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def salvar_alias(collection_name, nome_fisico):
+    """Aponta o alias para a nova versão. Escrita atômica: a API nunca lê um arquivo pela metade."""
+    aliases = ler_aliases()
+    aliases[collection_name] = nome_fisico
+    tmp = ALIAS_COLECOES_PATH.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(aliases, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, ALIAS_COLECOES_PATH)
 
-# Inicializa ChromaDB (Persistente)
-print(f"📂 Criando/Abrindo banco ChromaDB em: {CHROMA_DB_DIR}")
-client = chromadb.PersistentClient(path=str(CHROMA_DB_DIR))
+def versoes_existentes(collection_name):
+    """{versão: nome físico} das coleções já criadas. A coleção sem sufixo (legado) é a versão 0."""
+    padrao = re.compile(rf"^{re.escape(collection_name)}(?:__v(\d+))?$")
+    versoes = {}
+    for col in client.list_collections():
+        nome = col if isinstance(col, str) else col.name
+        m = padrao.match(nome)
+        if m:
+            versoes[int(m.group(1) or 0)] = nome
+    return versoes
+
+def remover_versoes_antigas(collection_name, versao_atual):
+    for versao, nome in versoes_existentes(collection_name).items():
+        if versao <= versao_atual - VERSOES_MANTIDAS:
+            client.delete_collection(nome)
+            shutil.rmtree(INDICE_NUMPY_DIR / nome, ignore_errors=True)
+            shutil.rmtree(TOKENS_PASSAGENS_DIR / nome, ignore_errors=True)
+            shutil.rmtree(TEXTOS_DECISOES_DIR / nome, ignore_errors=True)
+            print(f"   ↳ Versão antiga {nome} removida.")
 
 def migrate_pkl(filename, collection_name):
     pkl_path = DB_DIR / filename
@@ -43,10 +112,11 @@ def migrate_pkl(filename, collection_name):
         df = df.iloc[:min_len]
         vectors = vectors[:min_len]
 
-        # Cria/Reseta coleção
-        try: client.delete_collection(collection_name)
-        except: pass
-        collection = client.create_collection(name=collection_name)
+        # Cria a próxima versão; a atual continua atendendo a API até a troca do alias
+        versao = max(versoes_existentes(collection_name), default=0) + 1
+        nome_fisico = f"{collection_name}__v{versao}"
+        print(f"   ↳ Construindo versão {nome_fisico}...")
+        collection = client.create_collection(name=nome_fisico)
 
         # Prepara dados para inserção em lote (batch)
         batch_size = 500
@@ -56,19 +126,26 @@ def migrate_pkl(filename, collection_name):
         embeddings = []
         documents = []
         metadatas = []
+        resumos = []
+        links = []
 
         for idx, row in df.iterrows():
             ids.append(f"{collection_name}_{idx}")
             embeddings.append(vectors[idx].tolist()) # Chroma precisa de lista, não numpy
             documents.append(row.get("texto_para_embedding", ""))
+            # Textos longos vão para textos_decisoes/ (lidos só para os casos exibidos)
+            resumos.append(str(row.get("resumo", ""))[:1000]) # Limita tamanho
+            links.append(str(row.get("link_acordao") or row.get("link_teor") or row.get("link") or "#"))
             
-            # Metadata (somente tipos primitivos)
+            # Metadata (somente tipos primitivos e curtos: volta em toda consulta)
+            vitoria, valor = classificar_resultado(row.get("resultado", ""), row.get("valor_total", 0))
             meta = {
-                "resumo": str(row.get("resumo", ""))[:1000], # Limita tamanho
                 "data_julgamento": str(row.get("data_julgamento", "")),
                 "resultado": str(row.get("resultado", "")),
                 "valor_total": float(row.get("valor_total", 0)),
-                "link": str(row.get("link_acordao") or row.get("link_teor") or row.get("link") or "#")
+                # Desfecho já classificado (a API não reaplica a regra a cada consulta)
+                "vitoria": vitoria,
+                "valor": valor
             }
             metadatas.append(meta)
 
@@ -79,11 +156,27 @@ def migrate_pkl(filename, collection_name):
             collection.add(
                 ids=ids[i:end],
                 embeddings=embeddings[i:end],
-                documents=documents[i:end],
                 metadatas=metadatas[i:end]
             )
             
-        print(f"✅ Sucesso! {total} documentos inseridos na coleção '{collection_name}'.")
+        print(f"✅ Sucesso! {total} documentos inseridos na coleção '{nome_fisico}'.")
+
+        salvar_textos(TEXTOS_DECISOES_DIR / nome_fisico, ids, {"documento": documents, "resumo": resumos, "link": links})
+        print(f"✅ Textos das decisões salvos em {TEXTOS_DECISOES_DIR / nome_fisico}.")
+
+        # Mesmos vetores e metadados no formato do índice NumPy (BUSCA_BACKEND=numpy na API)
+        salvar_indice(INDICE_NUMPY_DIR / nome_fisico, ids, embeddings, [], metadatas, INDICE_NUMPY_DTYPE, INDICE_PCA_DIM)
+        print(f"✅ Índice NumPy salvo em {INDICE_NUMPY_DIR / nome_fisico}.")
+        if INDICE_PCA_DIM:
+            print(f"   ↳ PCA {INDICE_PCA_DIM}d: recall@20 contra os vetores completos = {recall_pca(INDICE_NUMPY_DIR / nome_fisico):.4f}")
+
+        salvar_tokens(TOKENS_PASSAGENS_DIR / nome_fisico, ids, documents, tokenizer_cross, MODELO_CROSS)
+        print(f"✅ Passagens tokenizadas salvas em {TOKENS_PASSAGENS_DIR / nome_fisico}.")
+
+        # Só agora a versão nova passa a valer
+        salvar_alias(collection_name, nome_fisico)
+        print(f"🔄 Alias {collection_name} -> {nome_fisico}. A API troca de versão em alguns segundos.")
+        remover_versoes_antigas(collection_name, versao)
 
     except Exception as e:
         print(f"❌ Erro ao migrar {filename}: {e}")
@@ -0,0 +1,44 @@
+import asyncio
+import time
+from micro_lotes import MicroBatcher
+
+# Uso: ../venv/bin/python -m pytest -q test_micro_lotes.py
+
+async def _enviar(batcher, n, intervalo_s):
+    tarefas = []
+    for i in range(n):
+        tarefas.append(asyncio.create_task(batcher.submeter(i)))
+        await asyncio.sleep(intervalo_s)
+    return await asyncio.gather(*tarefas)
+
+def _rodar(tamanho_max, espera_ms, n, intervalo_s=0.01):
+    lotes = []
+
+    async def processar(itens):
+        lotes.append((time.perf_counter(), list(itens)))
+        return [i * 2 for i in itens]
+
+    async def principal():
+        batcher = MicroBatcher("teste", processar, tamanho_max, espera_ms)
+        inicio = time.perf_counter()
+        resultados = await _enviar(batcher, n, intervalo_s)
+        return inicio, resultados
+
+    inicio, resultados = asyncio.run(principal())
+    return [(t - inicio, itens) for t, itens in lotes], resultados
+
+def test_lote_cheio_sai_antes_da_janela():
+    lotes, resultados = _rodar(tamanho_max=4, espera_ms=300, n=4)
+    assert resultados == [0, 2, 4, 6]
+    assert [itens for _, itens in lotes] == [[0, 1, 2, 3]]
+    assert lotes[0][0] < 0.15
+
+def test_lote_incompleto_espera_a_janela():
+    lotes, _ = _rodar(tamanho_max=4, espera_ms=200, n=3)
+    assert [itens for _, itens in lotes] == [[0, 1, 2]]
+    assert lotes[0][0] >= 0.19
+
+def test_excedente_vai_para_o_lote_seguinte():
+    lotes, resultados = _rodar(tamanho_max=2, espera_ms=300, n=3, intervalo_s=0)
+    assert resultados == [0, 2, 4]
+    assert [itens for _, itens in lotes][0] == [0, 1]
@@ -0,0 +1,48 @@
+import json
+import numpy as np
+from pathlib import Path
+
+# Textos longos das decisões (passagem, resumo, link) fora do ChromaDB. Cada campo é um
+# arquivo de bytes UTF-8 concatenados + offsets, lidos por memory-map: a busca devolve
+# só ids/distâncias/metadados numéricos e o texto é lido apenas para os casos exibidos.
+
+CURRENT_DIR = Path(__file__).resolve().parent
+TEXTOS_DECISOES_DIR = CURRENT_DIR / "textos_decisoes"
+
+def salvar_textos(diretorio, ids, campos):
+    """Grava {campo: [texto por documento]} na ordem de `ids`."""
+    diretorio = Path(diretorio)
+    diretorio.mkdir(parents=True, exist_ok=True)
+
+    for campo, textos in campos.items():
+        dados = [str(t or "").encode("utf-8") for t in textos]
+        offsets = np.zeros(len(dados) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(d) for d in dados])
+        with open(diretorio / f"{campo}.bin", "wb") as f:
+            f.write(b"".join(dados))
+        np.save(diretorio / f"{campo}_offsets.npy", offsets)
+
+    with open(diretorio / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"campos": list(campos), "ids": list(ids)}, f, ensure_ascii=False)
+
+class TextosDecisoes:
+    """Leitura dos textos de uma versão de coleção pelo id do documento."""
+
+    def __init__(self, diretorio):
+        self.diretorio = Path(diretorio)
+        with open(self.diretorio / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.posicoes = {doc_id: i for i, doc_id in enumerate(meta["ids"])}
+        self.campos = {}
+        for campo in meta["campos"]:
+            caminho = self.diretorio / f"{campo}.bin"
+            # memmap não aceita arquivo vazio (coleção sem textos nesse campo)
+            dados = np.memmap(caminho, dtype=np.uint8, mode="r") if caminho.stat().st_size else np.empty(0, dtype=np.uint8)
+            self.campos[campo] = (dados, np.load(self.diretorio / f"{campo}_offsets.npy", mmap_mode="r"))
+
+    def obter(self, doc_id, campo, padrao=""):
+        i = self.posicoes.get(doc_id)
+        if i is None or campo not in self.campos:
+            return padrao
+        dados, offsets = self.campos[campo]
+        return dados[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
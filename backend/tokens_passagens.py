@@ -0,0 +1,52 @@
+import json
+import numpy as np
+from pathlib import Path
+
+# Passagens de jurisprudência já tokenizadas para o CrossEncoder, gravadas na migração.
+# Os ids de todas as passagens ficam num único array int32 (memory-mapped) com offsets,
+# então o reranking monta os pares sem tokenizar as decisões a cada requisição.
+
+CURRENT_DIR = Path(__file__).resolve().parent
+TOKENS_PASSAGENS_DIR = CURRENT_DIR / "tokens_passagens"
+
+def texto_passagem(documento):
+    """Texto da decisão como entra no par do CrossEncoder (sem o prefixo do e5)."""
+    return (documento or "").replace("passage:", "").strip()
+
+def salvar_tokens(diretorio, ids, documentos, tokenizer, modelo, lote=256):
+    """Tokeniza (sem tokens especiais) e grava as passagens da coleção."""
+    diretorio = Path(diretorio)
+    diretorio.mkdir(parents=True, exist_ok=True)
+
+    sequencias = []
+    for i in range(0, len(documentos), lote):
+        textos = [texto_passagem(d) for d in documentos[i:i + lote]]
+        sequencias.extend(tokenizer(textos, add_special_tokens=False)["input_ids"])
+
+    offsets = np.zeros(len(sequencias) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in sequencias])
+    tokens = np.fromiter((t for s in sequencias for t in s), dtype=np.int32, count=int(offsets[-1]))
+
+    np.save(diretorio / "tokens.npy", tokens)
+    np.save(diretorio / "offsets.npy", offsets)
+    with open(diretorio / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"modelo": modelo, "ids": list(ids)}, f, ensure_ascii=False)
+
+class TokensPassagens:
+    """Consulta dos ids de token de uma passagem pelo id do documento."""
+
+    def __init__(self, diretorio):
+        self.diretorio = Path(diretorio)
+        self.tokens = np.load(self.diretorio / "tokens.npy", mmap_mode="r")
+        self.offsets = np.load(self.diretorio / "offsets.npy", mmap_mode="r")
+        with open(self.diretorio / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.modelo = meta["modelo"]
+        self.posicoes = {doc_id: i for i, doc_id in enumerate(meta["ids"])}
+
+    def obter(self, doc_id):
+        """Lista de ids de token da passagem, ou None se o documento não estiver no arquivo."""
+        i = self.posicoes.get(doc_id)
+        if i is None:
+            return None
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]].tolist()
@@ -196,35 +196,18 @@ export default function App() {
   }, [analiseId]);
 
   const [loadingProgress, setLoadingProgress] = useState(0);
+  // Etapas já concluídas no backend (eventos do /analisar/stream)
+  const [etapasAnalise, setEtapasAnalise] = useState<{ categoria?: string, n_casos?: number }>({});
 
-  // ... (dentro de useEffect)
-  
-  // Loading Text Animation
+  // Loading Progress Animation
   useEffect(() => {
     if (step === 'LOADING') {
-      const msgs = [
-        "Analisando seu relato com Inteligência Artificial...",
-        "Consultando jurisprudência no TJPR...",
-        "Comparando com 5.000+ casos similares...",
-        "Calculando probabilidade de êxito..."
-      ];
-      
-      let currentEtapa = 0;
       setLoadingProgress(0);
-      setLoadingText(msgs[0]);
-
-      // Gerencia as mensagens (1s cada, sem loop, para no último)
-      const textInterval = setInterval(() => {
-        currentEtapa++;
-        if (currentEtapa < msgs.length) {
-          setLoadingText(msgs[currentEtapa]);
-        } else {
-          clearInterval(textInterval); // Para no último
-        }
-      }, 1000);
+      setLoadingText("Analisando seu relato com Inteligência Artificial...");
 
       // Gerencia a barra de progresso (Logarítmica/Assimptótica)
-      // Começa rápido, depois desacelera para nunca chegar a 100% antes da resposta
+      // Começa rápido, depois desacelera para nunca chegar a 100% antes da resposta.
+      // Os textos e os saltos da barra vêm das etapas reais (handleEtapaAnalise).
       const progressInterval = setInterval(() => {
         setLoadingProgress(prev => {
           if (prev >= 95) return 95; // Trava em 95%
@@ -236,7 +219,6 @@ export default function App() {
       }, 100);
 
       return () => {
-        clearInterval(textInterval);
         clearInterval(progressInterval);
       };
     }
@@ -263,6 +245,23 @@ export default function App() {
 
   // --- ACTIONS ---
 
+  // Cada etapa concluída no backend atualiza o texto e adianta a barra até o seu marco.
+  // A probabilidade em si só aparece no resultado (bloqueado até salvar o contato).
+  const handleEtapaAnalise = (evento: string, dados: any) => {
+    if (evento === 'categoria') {
+      setEtapasAnalise(prev => ({ ...prev, categoria: dados.categoria }));
+      setLoadingText("Consultando jurisprudência nos tribunais...");
+      setLoadingProgress(prev => Math.max(prev, 40));
+    } else if (evento === 'casos_similares') {
+      setEtapasAnalise(prev => ({ ...prev, n_casos: dados.n_casos }));
+      setLoadingText(`Comparando com ${dados.n_casos} casos similares...`);
+      setLoadingProgress(prev => Math.max(prev, 70));
+    } else if (evento === 'probabilidade') {
+      setLoadingText("Calculando probabilidade de êxito...");
+      setLoadingProgress(prev => Math.max(prev, 90));
+    }
+  };
+
   const handleAnalyze = async () => {
     if (inputValue.length < 10) {
       trackEvent("error_input_too_short");
@@ -270,8 +269,9 @@ export default function App() {
     }
     setStep('LOADING');
     setIsAnalysisUnlocked(false); // RESET: Força o bloqueio para a nova análise exigir salvamento
+    setEtapasAnalise({});
     try {
-      const data = await api.analyze(inputValue);
+      const data = await api.analyzeStream(inputValue, handleEtapaAnalise);
       setResultData(data);
       setAnaliseId(data.id_analise);
       trackEvent("analysis_completed");
@@ -438,6 +438,16 @@ export default function App() {
       <div className="mt-8 flex flex-col items-center gap-4 w-full px-8">
         <Loader2 className="size-12 text-[#1c80b2] animate-spin" />
         <p className="text-[#0f172a] font-bold text-xl animate-pulse text-center">{loadingText}</p>
+
+        {/* Etapas já concluídas */}
+        {etapasAnalise.categoria && (
+          <div className="flex flex-col gap-1 text-sm text-[#64748b]">
+            <span className="flex items-center gap-2"><CheckCircle className="size-4 text-[#22c55e]" /> Caso identificado: <strong className="text-[#0f172a]">{etapasAnalise.categoria.replace(/_/g, ' ')}</strong></span>
+            {etapasAnalise.n_casos !== undefined && (
+              <span className="flex items-center gap-2"><CheckCircle className="size-4 text-[#22c55e]" /> {etapasAnalise.n_casos} casos similares encontrados</span>
+            )}
+          </div>
+        )}
         
         {/* Barra de Progresso Falsa */}
         <div className="w-full bg-gray-200 rounded-full h-2.5 mt-2 overflow-hidden">
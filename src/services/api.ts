@@ -33,6 +33,49 @@ export const api = {
         }
     },
 
+    // Variante em streaming (SSE): onEvento recebe cada etapa concluída
+    // ("categoria", "casos_similares", "probabilidade") antes do resultado final.
+    analyzeStream: async (relato: string, onEvento?: (evento: string, dados: any) => void) => {
+        const response = await fetch(`${BASE_URL}/analisar/stream`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ relato }),
+        });
+
+        // Mesmo formato de erro do axios (error.response.status) para o tratamento de 429 no App
+        const falha = (detail: string, status?: number) => Object.assign(new Error(detail), { response: { status } });
+
+        if (!response.ok || !response.body) {
+            const erro = await response.json().catch(() => ({}));
+            throw falha(erro.detail || "Erro na análise", response.status);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Eventos SSE são separados por linha em branco
+            const blocos = buffer.split('\n\n');
+            buffer = blocos.pop() || '';
+            for (const bloco of blocos) {
+                const evento = bloco.match(/^event: (.*)$/m)?.[1];
+                const dados = bloco.match(/^data: (.*)$/m)?.[1];
+                if (!evento || !dados) continue;
+
+                const payload = JSON.parse(dados);
+                if (evento === 'erro') throw falha(payload.detail, payload.status);
+                if (evento === 'resultado') return payload;
+                onEvento?.(evento, payload);
+            }
+        }
+        throw new Error("Conexão encerrada antes do resultado da análise");
+    },
+
     pagar: async (payload: any) => {
         const { data } = await axiosInstance.post('/pagar', payload);
         return data;